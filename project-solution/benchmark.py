@@ -0,0 +1,189 @@
+"""
+Benchmark runner for the Brewin interpreters.
+
+Runs every program in benchmarks/v<N>/ on each interpreter for that version
+(interpreterv<N> and interpreterv<N>_alt, plus the bytecode VMs of interpreterv3
+and interpreterv4) and writes a JSON report with parse time, execution time,
+peak memory and retained memory blocks. Reports from different commits can be
+compared with --compare. The VMs are a deep-recursion mode rather than a faster
+backend; they are measured so that their cost relative to the default backend
+stays visible.
+
+usage: python benchmark.py [--repeat N] [--output FILE] [--compare OLD.json] [FILTER ...]
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from os import listdir, path
+
+import brewparse
+
+BENCHMARK_DIR = path.join(path.dirname(path.abspath(__file__)), "benchmarks")
+
+# (label, module, extra Interpreter keyword arguments) for each version
+INTERPRETERS = {
+    "1": [("interpreterv1", "interpreterv1", {})],
+    "2": [("interpreterv2", "interpreterv2", {}), ("interpreterv2_alt", "interpreterv2_alt", {})],
+    "3": [
+        ("interpreterv3", "interpreterv3", {}),
+        ("interpreterv3_vm", "interpreterv3", {"use_vm": True}),
+        ("interpreterv3_alt", "interpreterv3_alt", {}),
+    ],
+    "4": [
+        ("interpreterv4", "interpreterv4", {}),
+        ("interpreterv4_vm", "interpreterv4", {"use_vm": True}),
+        ("interpreterv4_alt", "interpreterv4_alt", {}),
+    ],
+}
+
+
+def extract_expected(source):
+    """Return the lines between the *OUT* markers of a benchmark, like tester.py does."""
+    expected = []
+    in_output = False
+    for line in source.splitlines():
+        if line.strip() == "*OUT*":
+            in_output = not in_output
+        elif in_output:
+            expected.append(line)
+    return expected
+
+
+def time_parse(source, repeat):
+    """Best time to parse source, in ms, with brewparse's AST cache emptied before each parse."""
+    best = None
+    for _ in range(repeat):
+        brewparse.ast_cache.clear()
+        start = time.perf_counter()
+        brewparse.parse_program(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def run_once(module, kwargs, source):
+    """Run source on a fresh interpreter; returns its output, or raises what it raised."""
+    interpreter = module.Interpreter(False, None, False, **kwargs)
+    interpreter.run(source)
+    return interpreter.get_output()
+
+
+def measure(module, kwargs, source, repeat):
+    """Measure one benchmark on one interpreter; returns the report entry's metrics."""
+    expected = extract_expected(source)
+    metrics = {"parse_ms": round(time_parse(source, repeat), 3)}
+
+    # an untimed run leaves the AST in brewparse's cache, in whatever form the interpreter
+    # parses it into, so the timed runs measure execution (including any compilation)
+    try:
+        run_once(module, kwargs, source)
+    except BaseException:  # pylint: disable=broad-except
+        pass  # reported by the timed run below
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            output = run_once(module, kwargs, source)
+        except BaseException as exception:  # pylint: disable=broad-except
+            metrics["status"] = f"error: {exception}"
+            return metrics
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    metrics["exec_ms"] = round(best * 1000, 3)
+    metrics["status"] = "ok" if output == expected else "wrong output"
+
+    # memory is measured in a separate run, since tracing slows execution down a lot.
+    # CPython has no allocation counter, so instead of allocations this reports the memory
+    # blocks still allocated after the run (i.e. what the interpreter retained, such as its caches)
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    run_once(module, kwargs, source)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    metrics["peak_memory_kb"] = round(peak / 1024, 1)
+    metrics["retained_blocks"] = sys.getallocatedblocks() - blocks_before
+    return metrics
+
+
+def get_commit():
+    """Return the current git commit, or None outside a git checkout."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=BENCHMARK_DIR
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_benchmarks(repeat, filters):
+    """Run every benchmark (whose name contains one of filters, if any); returns the report."""
+    results = []
+    for version in sorted(INTERPRETERS):
+        version_dir = path.join(BENCHMARK_DIR, f"v{version}")
+        if not path.isdir(version_dir):
+            continue
+        for filename in sorted(listdir(version_dir)):
+            name = f"v{version}/{filename.split('.')[0]}"
+            if not filename.endswith(".br") or (filters and not any(f in name for f in filters)):
+                continue
+            with open(path.join(version_dir, filename), encoding="utf-8") as handle:
+                source = handle.read()
+            for label, module_name, kwargs in INTERPRETERS[version]:
+                module = importlib.import_module(module_name)
+                metrics = measure(module, kwargs, source, repeat)
+                print(f"{name:24} {label:20} {metrics.get('exec_ms', '-'):>10} ms  {metrics['status']}")
+                results.append({"benchmark": name, "interpreter": label, **metrics})
+    return {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(old_report, new_report):
+    """Print the change in execution time for each benchmark/interpreter in both reports."""
+    old = {(r["benchmark"], r["interpreter"]): r for r in old_report["results"]}
+    print(f"\ncompared with {old_report.get('commit') or 'old report'}:")
+    for result in new_report["results"]:
+        before = old.get((result["benchmark"], result["interpreter"]))
+        if before is None or "exec_ms" not in before or "exec_ms" not in result:
+            continue
+        ratio = before["exec_ms"] / result["exec_ms"] if result["exec_ms"] else float("inf")
+        print(
+            f"{result['benchmark']:24} {result['interpreter']:20} "
+            f"{before['exec_ms']:>10} -> {result['exec_ms']:>10} ms  ({ratio:.2f}x)"
+        )
+
+
+def main():
+    """main entrypoint: runs the benchmarks, writes the JSON report, optionally compares"""
+    parser = argparse.ArgumentParser(description="Benchmark the Brewin interpreters.")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the best is kept")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON report")
+    parser.add_argument("--compare", help="an earlier report to compare execution times with")
+    parser.add_argument("filters", nargs="*", help="only run benchmarks whose name contains one of these")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.repeat, args.filters)
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=4)
+    print(f"wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            compare(json.load(handle), report)
+
+
+if __name__ == "__main__":
+    main()
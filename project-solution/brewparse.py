@@ -1,3 +1,9 @@
+import hashlib
+import os
+import pickle
+import sys
+from collections import OrderedDict
+
 from element import Element
 from brewlex import *
 from intbase import InterpreterBase
@@ -14,6 +20,17 @@ precedence = (
     ("right", "UMINUS", "NOT"),
 )
 
+# the grammar actions build every node with new_node(elem_type, **fields); parse_program
+# sets it to the node_factory it's given for the length of a parse
+new_node = Element
+
+# records the position of the token at p[index] on the node being built, p[0]
+def set_position(p, index):
+    lexpos = p.lexpos(index)
+    p[0].line_num = p.lineno(index)
+    p[0].col_num = lexpos - p.lexer.lexdata.rfind("\n", 0, lexpos)
+
+
 def collapse_items(p, group_index, singleton_index):
     if len(p) == 2:
         p[0] = [p[1]]
@@ -26,9 +43,9 @@ def p_program(p):
     """program : structs funcs
     | funcs"""
     if len(p) == 2:
-        p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=[], functions=p[1])
+        p[0] = new_node(InterpreterBase.PROGRAM_NODE, structs=[], functions=p[1])
     else:
-        p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=p[1], functions=p[2])
+        p[0] = new_node(InterpreterBase.PROGRAM_NODE, structs=p[1], functions=p[2])
 
 def p_structs(p):
     """structs : structs struct
@@ -37,7 +54,8 @@ def p_structs(p):
 
 def p_struct(p):
    "struct : STRUCT NAME LBRACE fields RBRACE"
-   p[0] = Element(InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4])
+   p[0] = new_node(InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4])
+   set_position(p, 1)
 
 def p_fields(p):
    """fields : fields field
@@ -46,7 +64,8 @@ def p_fields(p):
 
 def p_field(p):
   "field : NAME COLON NAME SEMI"  # field_name: type
-  p[0] = Element(InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3])
+  p[0] = new_node(InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3])
+  set_position(p, 1)
 
 def p_funcs(p):
     """funcs : funcs func
@@ -58,17 +77,19 @@ def p_func(p):
     """func : FUNC NAME LPAREN formal_args RPAREN COLON NAME LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN COLON NAME LBRACE statements RBRACE"""
     if len(p) == 11:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9])
+        p[0] = new_node(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8])
+        p[0] = new_node(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8])
+    set_position(p, 1)
 
 def p_func2(p):
     """func : FUNC NAME LPAREN formal_args RPAREN LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 9:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7])
+        p[0] = new_node(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6])
+        p[0] = new_node(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6])
+    set_position(p, 1)
 
 def p_formal_args(p):
     """formal_args : formal_args COMMA formal_arg
@@ -80,9 +101,10 @@ def p_formal_arg(p):
     """formal_arg : NAME COLON NAME
     | NAME"""
     if len(p) == 2:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = None)
+      p[0] = new_node(InterpreterBase.ARG_NODE, name=p[1], var_type = None)
     else:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = p[3])
+      p[0] = new_node(InterpreterBase.ARG_NODE, name=p[1], var_type = p[3])
+    set_position(p, 1)
 
 def p_statements(p):
     """statements : statements statement
@@ -96,15 +118,17 @@ def p_statement___assign(p):
 
 def p_assign(p):
     "assign : variable_w_dot ASSIGN expression"
-    p[0] = Element("=", name=p[1], expression=p[3])
+    p[0] = new_node("=", name=p[1], expression=p[3])
+    set_position(p, 1)
 
 def p_statement___var(p):
     """statement : VAR variable COLON NAME SEMI
     | VAR variable SEMI"""
     if len(p) == 6:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4])
+      p[0] = new_node(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4])
     else:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None)
+      p[0] = new_node(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None)
+    set_position(p, 1)
 
 def p_variable(p):
     "variable : NAME"
@@ -117,29 +141,34 @@ def p_variable_w_dot(p):
         p[0] = p[1] + "." + p[3]
     else:
         p[0] = p[1]
+    # pass the name's position up to the rule that uses it
+    p.set_lineno(0, p.lineno(1))
+    p.set_lexpos(0, p.lexpos(1))
 
 def p_statement_if(p):
     """statement : IF LPAREN expression RPAREN LBRACE statements RBRACE
     | IF LPAREN expression RPAREN LBRACE statements RBRACE ELSE LBRACE statements RBRACE
     """
     if len(p) == 8:
-        p[0] = Element(
+        p[0] = new_node(
             InterpreterBase.IF_NODE,
             condition=p[3],
             statements=p[6],
             else_statements=None,
         )
     else:
-        p[0] = Element(
+        p[0] = new_node(
             InterpreterBase.IF_NODE,
             condition=p[3],
             statements=p[6],
             else_statements=p[10],
         )
+    set_position(p, 1)
 
 def p_statement_try(p):
     """statement : TRY LBRACE statements RBRACE catchers"""
-    p[0] = Element(InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5])
+    p[0] = new_node(InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5])
+    set_position(p, 1)
 
 def p_catches(p):
     """catchers : catchers catch
@@ -148,15 +177,18 @@ def p_catches(p):
 
 def p_catch(p):
     "catch : CATCH STRING LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4])
+    p[0] = new_node(InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4])
+    set_position(p, 1)
 
 def p_statement_for(p):
     "statement : FOR LPAREN assign SEMI expression SEMI assign RPAREN LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10])
+    p[0] = new_node(InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10])
+    set_position(p, 1)
 
 def p_statement_raise(p):
     "statement : RAISE expression SEMI"
-    p[0] = Element(InterpreterBase.RAISE_NODE, exception_type=p[2])
+    p[0] = new_node(InterpreterBase.RAISE_NODE, exception_type=p[2])
+    set_position(p, 1)
 
 def p_statement_expr(p):
     "statement : expression SEMI"
@@ -170,21 +202,25 @@ def p_statement_return(p):
         expr = p[2]
     else:
         expr = None
-    p[0] = Element(InterpreterBase.RETURN_NODE, expression=expr)
+    p[0] = new_node(InterpreterBase.RETURN_NODE, expression=expr)
+    set_position(p, 1)
 
 
 def p_expression_not(p):
     "expression : NOT expression"
-    p[0] = Element(InterpreterBase.NOT_NODE, op1=p[2])
+    p[0] = new_node(InterpreterBase.NOT_NODE, op1=p[2])
+    set_position(p, 1)
 
 
 def p_expression_uminus(p):
     "expression : MINUS expression %prec UMINUS"
-    p[0] = Element(InterpreterBase.NEG_NODE, op1=p[2])
+    p[0] = new_node(InterpreterBase.NEG_NODE, op1=p[2])
+    set_position(p, 1)
 
 def p_expression_new(p):
     "expression : NEW NAME"
-    p[0] = Element(InterpreterBase.NEW_NODE, var_type=p[2])
+    p[0] = new_node(InterpreterBase.NEW_NODE, var_type=p[2])
+    set_position(p, 1)
 
 
 def p_arith_expression_binop(p):
@@ -198,7 +234,8 @@ def p_arith_expression_binop(p):
     | expression MINUS expression
     | expression MULTIPLY expression
     | expression DIVIDE expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = new_node(p[2], op1=p[1], op2=p[3])
+    set_position(p, 2)
 
 
 def p_expression_group(p):
@@ -209,43 +246,50 @@ def p_expression_group(p):
 def p_expression_and_or(p):
     """expression : expression OR expression
     | expression AND expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = new_node(p[2], op1=p[1], op2=p[3])
+    set_position(p, 2)
 
 
 def p_expression_number(p):
     "expression : NUMBER"
-    p[0] = Element(InterpreterBase.INT_NODE, val=p[1])
+    p[0] = new_node(InterpreterBase.INT_NODE, val=p[1])
+    set_position(p, 1)
 
 
 def p_expression_bool(p):
     """expression : TRUE
     | FALSE"""
     bool_val = p[1] == InterpreterBase.TRUE_DEF
-    p[0] = Element(InterpreterBase.BOOL_NODE, val=bool_val)
+    p[0] = new_node(InterpreterBase.BOOL_NODE, val=bool_val)
+    set_position(p, 1)
 
 
 def p_expression_nil(p):
     "expression : NIL"
-    p[0] = Element(InterpreterBase.NIL_NODE)
+    p[0] = new_node(InterpreterBase.NIL_NODE)
+    set_position(p, 1)
 
 
 def p_expression_string(p):
     "expression : STRING"
-    p[0] = Element(InterpreterBase.STRING_NODE, val=p[1])
+    p[0] = new_node(InterpreterBase.STRING_NODE, val=p[1])
+    set_position(p, 1)
 
 
 def p_expression_variable(p):
     "expression : variable_w_dot"
-    p[0] = Element(InterpreterBase.VAR_NODE, name=p[1])
+    p[0] = new_node(InterpreterBase.VAR_NODE, name=p[1])
+    set_position(p, 1)
 
 
 def p_func_call(p):
     """expression : NAME LPAREN args RPAREN
     | NAME LPAREN RPAREN"""
     if len(p) == 5:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=p[3])
+        p[0] = new_node(InterpreterBase.FCALL_NODE, name=p[1], args=p[3])
     else:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=[])
+        p[0] = new_node(InterpreterBase.FCALL_NODE, name=p[1], args=[])
+    set_position(p, 1)
 
 
 def p_expression_args(p):
@@ -262,13 +306,132 @@ def p_error(p):
 
 
 # exported function
-def parse_program(program):
+# node_factory builds the AST's nodes; it's called like Element, with the node's elem_type
+# and its fields as keyword arguments, and its nodes must take line_num and col_num attributes
+def parse_program(program, node_factory=Element):
+    global new_node
+    key = ast_cache.key(program, node_factory)
+    ast = ast_cache.get(key)
+    if ast is not None:
+        return ast
     reset_lineno()
-    ast = yacc.parse(program)
+    new_node = node_factory
+    try:
+        ast = get_parser().parse(program, lexer=get_lexer())
+    finally:
+        new_node = Element
     if ast is None:
         raise SyntaxError("Syntax error")
+    ast_cache.put(key, ast)
     return ast
 
 
-# generate our parser
-yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
+# Parsed programs are cached by a hash of their source (and of the grammar and node factory
+# that built them), so running the same program again skips lexing and parsing entirely. The
+# most recently used ASTs are kept in memory; if cache_dir is set, ASTs are also pickled there
+# so they survive across processes. Interpreters must treat a cached AST as read-only, since
+# every run of the same program gets the same nodes back.
+class ASTCache:
+    def __init__(self, max_entries=64, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.grammar_hashes = {}  # node factory -> hash of the code that builds its ASTs
+
+    def key(self, program, node_factory=Element):
+        if node_factory not in self.grammar_hashes:
+            self.grammar_hashes[node_factory] = self.__hash_grammar(node_factory)
+        return hashlib.sha256((self.grammar_hashes[node_factory] + program).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        ast = self.__load(key)
+        if ast is not None:
+            self.__remember(key, ast)
+        return ast
+
+    def put(self, key, ast):
+        self.__remember(key, ast)
+        self.__store(key, ast)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __remember(self, key, ast):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = ast
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)  # evict the least recently used AST
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, key + ".pickle")
+
+    def __load(self, key):
+        if self.cache_dir is None or not os.path.exists(self.__path(key)):
+            return None
+        try:
+            with open(self.__path(key), "rb") as handle:
+                return pickle.load(handle)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            return None  # treat an unreadable entry as a miss
+
+    def __store(self, key, ast):
+        if self.cache_dir is None:
+            return
+        tmp_path = f"{self.__path(key)}.{os.getpid()}"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as handle:
+                pickle.dump(ast, handle, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.__path(key))
+        except (OSError, pickle.PicklingError, RecursionError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # ASTs produced by a different grammar or node factory must never be reused
+    def __hash_grammar(self, node_factory):
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        files = [os.path.join(here, name) for name in ("brewlex.py", "brewparse.py", "element.py")]
+        factory_file = getattr(sys.modules.get(node_factory.__module__), "__file__", None)
+        if factory_file is not None:
+            files.append(factory_file)
+        h.update(f"{node_factory.__module__}.{node_factory.__qualname__}".encode("utf-8"))
+        for name in files:
+            with open(name, "rb") as handle:
+                h.update(handle.read())
+        return h.hexdigest()
+
+
+# set BREWIN_AST_CACHE_DIR to share parsed programs between processes
+ast_cache = ASTCache(cache_dir=os.environ.get("BREWIN_AST_CACHE_DIR"))
+
+def configure_ast_cache(max_entries=64, cache_dir=None):
+    global ast_cache
+    ast_cache = ASTCache(max_entries, cache_dir)
+
+
+# The parser is generated the first time parse_program is called, not at import time.
+# Its LALR tables are pickled next to this module the first time they're built and loaded
+# from there by every later process; PLY only regenerates them if the grammar's signature
+# changes. Nothing is written to the working directory.
+PARSER_TABLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parsetab.pickle")
+parser = None
+
+def get_parser():
+    global parser
+    if parser is None:
+        if os.path.exists(PARSER_TABLES):
+            parser = yacc.yacc(debug=False, picklefile=PARSER_TABLES)
+        else:
+            # build into a private file and rename it into place, so processes starting
+            # concurrently never read a half-written table
+            tables = f"{PARSER_TABLES}.{os.getpid()}"
+            parser = yacc.yacc(debug=False, picklefile=tables)  # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
+            if os.path.exists(tables):
+                os.replace(tables, PARSER_TABLES)
+    return parser
@@ -0,0 +1,167 @@
+from intbase import InterpreterBase, ErrorType
+from type_valuev3 import Type, Value, TypeManager
+
+# Opcodes for the Brewin v3 bytecode VM (see vm_v3.py). An instruction is an (opcode, arg)
+# tuple; the comment after each opcode describes its arg and what it does to the frame's
+# operand stack. Variables live in the interpreter's EnvironmentManager, as they do when
+# the interpreter walks the AST, so the VM shares its checks and coercions.
+LOAD_CONST = 1  # Value; push it
+LOAD_VAR = 2  # variable name, possibly dotted; push the variable's value
+LOAD_VARIABLE = 3  # variable name, possibly dotted; push the Variable an assignment stores into
+ASSIGN = 4  # pop a value and a Variable, and assign the value to the Variable
+DEF_VAR = 5  # (name, type); define the variable in the innermost block
+NEW = 6  # struct type; push a new struct of that type
+BINARY = 7  # operator; pop right and left, push the result
+NEG = 8  # operator; pop the operand, push its negation
+NOT = 9  # operator; pop the operand, push its logical not
+JUMP = 10  # target
+JUMP_IF_FALSE = 11  # (target, error message); pop a condition and jump if it's false
+PUSH_BLOCK = 12  # start a block's scope
+POP_BLOCK = 13  # end the innermost block's scope
+BIND_ARG = 14  # formal arg ast; replace the actual arg on top of the stack with the Variable for it
+CALL = 15  # (function ast, number of args); pop the args' Variables and call the function
+CHECK_ARG = 16  # check that the top of the stack isn't void, as print and input arguments can't be
+PRINT = 17  # number of args; pop and print them, push void
+INPUT = 18  # (function name, has prompt); pop and print the prompt if any, push the input
+POP = 19  # discard the top of the stack
+RETURN = 20  # pop the return value and return it to the caller, checked against the return type
+RETURN_DEFAULT = 21  # return the default value of the function's return type
+FAIL = 22  # (error type, message); report an interpreter error
+
+
+# The compiled form of a function body
+class Code:
+    def __init__(self, name):
+        self.name = name
+        self.instructions = []
+
+    def emit(self, op, arg=None):
+        self.instructions.append((op, arg))
+        return len(self.instructions) - 1
+
+    def patch(self, index, arg):
+        self.instructions[index] = (self.instructions[index][0], arg)
+
+    def next_index(self):
+        return len(self.instructions)
+
+
+# Compiles function ASTs into Code objects. func_name_to_ast is the interpreter's function
+# table, so calls are resolved to the function they call when they're compiled
+class BytecodeCompiler:
+    NIL_VALUE = TypeManager.create_value(InterpreterBase.NIL_DEF)
+    BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+
+    def __init__(self, func_name_to_ast):
+        self.func_name_to_ast = func_name_to_ast
+
+    def compile_func(self, func_ast):
+        self.code = Code(func_ast.get("name"))
+        self.__compile_block(func_ast.get("statements"))
+        self.code.emit(RETURN_DEFAULT)  # DOCUMENT no return statement returns default value
+        return self.code
+
+    def __compile_block(self, statements):
+        self.code.emit(PUSH_BLOCK)
+        for statement in statements:
+            self.__compile_statement(statement)
+        self.code.emit(POP_BLOCK)
+
+    def __compile_statement(self, statement):
+        code = self.code
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__compile_call(statement)
+            code.emit(POP)
+        elif kind == "=":
+            # the variable is looked up before the expression is evaluated
+            code.emit(LOAD_VARIABLE, statement.get("name"))
+            self.__compile_expr(statement.get("expression"))
+            code.emit(ASSIGN)
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            code.emit(DEF_VAR, (statement.get("name"), statement.get("var_type")))
+        elif kind == InterpreterBase.RETURN_NODE:
+            if statement.get("expression") is None:
+                code.emit(RETURN_DEFAULT)  # DOCUMENT return; as returning default value
+            else:
+                self.__compile_expr(statement.get("expression"))
+                code.emit(RETURN)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__compile_expr(statement.get("condition"))
+            jump_to_else = code.emit(JUMP_IF_FALSE)
+            self.__compile_block(statement.get("statements"))
+            if statement.get("else_statements") is None:
+                code.patch(jump_to_else, (code.next_index(), "Incompatible type for if condition"))
+            else:
+                jump_to_end = code.emit(JUMP)
+                code.patch(jump_to_else, (code.next_index(), "Incompatible type for if condition"))
+                self.__compile_block(statement.get("else_statements"))
+                code.patch(jump_to_end, code.next_index())
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__compile_statement(statement.get("init"))
+            loop_start = code.next_index()
+            self.__compile_expr(statement.get("condition"))
+            jump_to_end = code.emit(JUMP_IF_FALSE)
+            self.__compile_block(statement.get("statements"))
+            self.__compile_statement(statement.get("update"))
+            code.emit(JUMP, loop_start)
+            code.patch(jump_to_end, (code.next_index(), "Incompatible type for for condition"))
+
+    def __compile_call(self, call_ast):
+        code = self.code
+        name = call_ast.get("name")
+        args = call_ast.get("args")
+        if name == "print":
+            for arg_ast in args:
+                self.__compile_expr(arg_ast)
+                code.emit(CHECK_ARG)
+            code.emit(PRINT, len(args))
+        elif name == "inputi" or name == "inputs":
+            if len(args) > 1:
+                code.emit(FAIL, (ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"))
+                return
+            for arg_ast in args:
+                self.__compile_expr(arg_ast)
+                code.emit(CHECK_ARG)
+            code.emit(INPUT, (name, len(args) == 1))
+        elif name not in self.func_name_to_ast:
+            code.emit(FAIL, (ErrorType.NAME_ERROR, f"Function {name} not found"))
+        elif len(args) not in self.func_name_to_ast[name]:
+            code.emit(FAIL, (ErrorType.NAME_ERROR, f"Function {name} taking {len(args)} params not found"))
+        else:
+            func_ast = self.func_name_to_ast[name][len(args)]
+            for formal_ast, actual_ast in zip(func_ast.get("args"), args):
+                self.__compile_expr(actual_ast)
+                code.emit(BIND_ARG, formal_ast)
+            code.emit(CALL, (func_ast, len(args)))
+
+    # emits code that pushes the value of an expression
+    def __compile_expr(self, expr_ast):
+        code = self.code
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.NIL_NODE:
+            code.emit(LOAD_CONST, BytecodeCompiler.NIL_VALUE)
+        elif kind == InterpreterBase.INT_NODE:
+            code.emit(LOAD_CONST, Value(Type.INT, expr_ast.get("val")))
+        elif kind == InterpreterBase.STRING_NODE:
+            code.emit(LOAD_CONST, Value(Type.STRING, expr_ast.get("val")))
+        elif kind == InterpreterBase.BOOL_NODE:
+            code.emit(LOAD_CONST, Value(Type.BOOL, expr_ast.get("val")))
+        elif kind == InterpreterBase.VAR_NODE:
+            code.emit(LOAD_VAR, expr_ast.get("name"))
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__compile_call(expr_ast)
+        elif kind == InterpreterBase.NEW_NODE:
+            code.emit(NEW, expr_ast.get("var_type"))
+        elif kind in BytecodeCompiler.BIN_OPS:
+            self.__compile_expr(expr_ast.get("op1"))
+            self.__compile_expr(expr_ast.get("op2"))
+            code.emit(BINARY, kind)
+        elif kind == InterpreterBase.NEG_NODE:
+            self.__compile_expr(expr_ast.get("op1"))
+            code.emit(NEG, kind)
+        elif kind == InterpreterBase.NOT_NODE:
+            self.__compile_expr(expr_ast.get("op1"))
+            code.emit(NOT, kind)
+        else:
+            code.emit(LOAD_CONST, None)
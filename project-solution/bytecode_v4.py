@@ -0,0 +1,300 @@
+from intbase import InterpreterBase, ErrorType
+from strictness_v4 import strict_assignments
+from type_valuev4 import Type, Value, bool_value, create_value, int_value
+
+# Opcodes for the Brewin v4 bytecode VM (see vm_v4.py). An instruction is an (opcode, arg)
+# tuple; the comment after each opcode describes its arg and what it does to the frame's
+# operand stack. A line in an arg is the source line reported with that instruction's errors.
+LOAD_CONST = 1  # Value; push it
+LOAD_VAR = 2  # local index; push the variable's value, forcing it if it's lazy
+LOAD_VAR_LAZY = 3  # local index; push the variable's value without forcing it
+MAKE_THUNK = 4  # (expr ast, thunk code, local indices); push a LazyValue capturing those locals
+STORE = 5  # local index; pop a value into the variable
+DEF_VAR = 6  # local index; set the variable to nil
+BINARY = 7  # [operator, left type, right type, function, line] inline cache; pop right and left, push the result (div0 raises)
+UNARY = 8  # (operator, operand type, function returning a Value, line); pop the operand, push the result
+LOGICAL_CHECK = 9  # (operator, line); check that the top of the stack is a bool
+SHORT_CIRCUIT = 10  # (value, target); if the top of the stack is that bool jump, else pop it
+JUMP = 11  # target
+JUMP_IF_FALSE = 12  # (target, error message, line); pop a bool and jump if it's false
+CALL = 13  # [function name, number of args, line, arg slots, code] with the last two filled in on first call; pop the args and call the function
+PRINT = 14  # number of args; pop and print them
+INPUT = 15  # (function name, has prompt); pop and print the prompt if any, push the input
+FORCE = 16  # replace the top of the stack with its evaluated value
+POP = 17  # discard the top of the stack
+RETURN = 18  # pop the return value and return it to the caller
+RETURN_NIL = 19  # return nil to the caller
+THUNK_RETURN = 20  # pop the thunk's value, cache it in the LazyValue and return it
+RAISE = 21  # line; pop the exception string and raise it
+FAIL = 22  # (error type, message, line); report an interpreter error
+RERAISE = 23  # index of an instruction; raise the exception being handled again, as if that instruction raised it
+
+
+# The compiled form of a function body or of a lazy expression
+class Code:
+    def __init__(self, name):
+        self.name = name
+        self.instructions = []
+        # (start, end, exception type, handler) for each catch clause, innermost try first; an
+        # exception type of None catches everything (see BytecodeCompiler.__compile_assign)
+        self.handlers = []
+        self.num_locals = 0
+
+    def emit(self, op, arg=None):
+        self.instructions.append((op, arg))
+        return len(self.instructions) - 1
+
+    def patch(self, index, arg):
+        self.instructions[index] = (self.instructions[index][0], arg)
+
+    def next_index(self):
+        return len(self.instructions)
+
+    # returns the instruction to jump to when exception_type is raised by the instruction at pc
+    def find_handler(self, pc, exception_type):
+        for start, end, handled_type, handler in self.handlers:
+            if start <= pc < end and (handled_type == exception_type or handled_type is None):
+                return handler
+        return None
+
+
+# Compiles function ASTs (compact nodes, addressed by a Resolver) into Code objects.
+#
+# Every block of a function gets its own range of locals within one flat frame: a block's
+# variables start where its enclosing block's end, and sibling blocks reuse the same range.
+# Lazy expressions are compiled into separate Code objects whose locals are just the
+# variables the expression reads, captured when the thunk is made. Strict assignments (see
+# strictness_v4.py) are evaluated right away instead, as the closure backend does.
+class BytecodeCompiler:
+    NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
+    LITERAL_NODES = {
+        InterpreterBase.NIL_NODE,
+        InterpreterBase.INT_NODE,
+        InterpreterBase.STRING_NODE,
+        InterpreterBase.BOOL_NODE,
+    }
+    BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+
+    # returns (slot of each formal arg, code) for a function
+    def compile_func(self, func_ast):
+        self.code = Code(func_ast.name)
+        self.thunk_addresses = None
+        self.bases = [0]
+        self.next_local = self.resolver.block_size(func_ast.args)
+        self.code.num_locals = self.next_local
+        arg_slots = [self.resolver.address(formal_ast)[1] for formal_ast in func_ast.args]
+        self.strict = strict_assignments(func_ast.statements, self.resolver)
+        self.fallbacks = []
+        self.__compile_block(func_ast.statements)
+        self.code.emit(RETURN_NIL)
+        self.__emit_fallbacks()
+        return arg_slots, self.code
+
+    def __compile_block(self, statements):
+        self.bases.append(self.next_local)
+        self.next_local += self.resolver.block_size(statements)
+        self.code.num_locals = max(self.code.num_locals, self.next_local)
+        for statement in statements:
+            self.__compile_statement(statement)
+        self.next_local = self.bases.pop()
+
+    # returns the local index of a variable node, or None if it's undefined at that point
+    def __local(self, node):
+        if self.thunk_addresses is not None:
+            return self.thunk_addresses.get(id(node))
+        address = self.resolver.address(node)
+        if address is None:
+            return None
+        depth, slot = address
+        return self.bases[depth] + slot
+
+    def __compile_statement(self, statement):
+        code = self.code
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__compile_call(statement)
+            code.emit(POP)
+        elif kind == "=":
+            self.__compile_assign(statement)
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            index = self.__local(statement)
+            if index is None:
+                code.emit(FAIL, (ErrorType.NAME_ERROR, f"Duplicate definition for variable {statement.name}", statement.line_num))
+            else:
+                code.emit(DEF_VAR, index)
+        elif kind == InterpreterBase.RETURN_NODE:
+            if statement.expression is None:
+                code.emit(RETURN_NIL)
+            else:
+                self.__compile_lazy_expr(statement.expression)
+                code.emit(RETURN)
+        elif kind == InterpreterBase.RAISE_NODE:
+            self.__compile_expr(statement.exception_type)
+            code.emit(RAISE, statement.line_num)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__compile_expr(statement.condition)
+            jump_to_else = code.emit(JUMP_IF_FALSE)
+            self.__compile_block(statement.statements)
+            if statement.else_statements is None:
+                code.patch(jump_to_else, (code.next_index(), "Incompatible type for if condition", statement.line_num))
+            else:
+                jump_to_end = code.emit(JUMP)
+                code.patch(jump_to_else, (code.next_index(), "Incompatible type for if condition", statement.line_num))
+                self.__compile_block(statement.else_statements)
+                code.patch(jump_to_end, code.next_index())
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__compile_statement(statement.init)
+            loop_start = code.next_index()
+            self.__compile_expr(statement.condition)
+            jump_to_end = code.emit(JUMP_IF_FALSE)
+            self.__compile_block(statement.statements)
+            self.__compile_statement(statement.update)
+            code.emit(JUMP, loop_start)
+            code.patch(jump_to_end, (code.next_index(), "Incompatible type for for condition", statement.line_num))
+        elif kind == InterpreterBase.TRY_NODE:
+            start = code.next_index()
+            self.__compile_block(statement.statements)
+            end = code.next_index()
+            jumps_to_end = [code.emit(JUMP)]
+            handlers = []
+            for catcher_ast in statement.catchers:
+                handlers.append((start, end, catcher_ast.exception_type, code.next_index()))
+                self.__compile_block(catcher_ast.statements)
+                jumps_to_end.append(code.emit(JUMP))
+            for jump in jumps_to_end:
+                code.patch(jump, code.next_index())
+            code.handlers.extend(handlers)
+
+    def __compile_assign(self, assign_ast):
+        code = self.code
+        expr_ast = assign_ast.expression
+        index = self.__local(assign_ast)
+        strict = (
+            id(assign_ast) in self.strict
+            and expr_ast.elem_type not in BytecodeCompiler.LITERAL_NODES
+            and expr_ast.elem_type != InterpreterBase.VAR_NODE
+        )
+        if not strict:
+            self.__compile_lazy_expr(expr_ast)
+            if index is None:
+                code.emit(FAIL, (ErrorType.NAME_ERROR, f"Undefined variable {assign_ast.name} in assignment", assign_ast.line_num))
+            else:
+                code.emit(STORE, index)
+            return
+
+        # evaluated right away; if that raises, the variable gets the thunk lazy evaluation
+        # would have left in it before the exception propagates (see Interpreter.__compile_strict_assign).
+        # The code that makes the thunk is compiled here, where the variables' locals are
+        # known, and moved to the end of the function by __emit_fallbacks
+        start = code.next_index()
+        self.__compile_expr(expr_ast)
+        store = code.emit(STORE, index)
+        self.__compile_lazy_expr(expr_ast)
+        fallback = code.instructions[store + 1:]
+        del code.instructions[store + 1:]
+        self.fallbacks.append((start, store, fallback + [(STORE, index), (RERAISE, store)]))
+
+    # emits the fallback code of the function's strict assignments, and the handlers that run
+    # it when their expressions raise. The handlers go first, since an assignment's expression
+    # is nested inside any try statement around it
+    def __emit_fallbacks(self):
+        code = self.code
+        handlers = []
+        for start, end, fallback in self.fallbacks:
+            handlers.append((start, end, None, code.next_index()))
+            code.instructions.extend(fallback)
+        code.handlers[:0] = handlers
+
+    def __compile_call(self, call_ast):
+        code = self.code
+        name = call_ast.name
+        args = call_ast.args
+        if name == "print":
+            for arg_ast in args:
+                self.__compile_expr(arg_ast)
+            code.emit(PRINT, len(args))
+        elif name == "inputi" or name == "inputs":
+            if len(args) > 1:
+                code.emit(FAIL, (ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter", call_ast.line_num))
+                return
+            for arg_ast in args:
+                self.__compile_expr(arg_ast)
+            code.emit(INPUT, (name, len(args) == 1))
+        else:
+            for arg_ast in args:
+                self.__compile_lazy_expr(arg_ast)
+            code.emit(CALL, [name, len(args), call_ast.line_num, None, None])
+
+    # emits code that pushes the value of an expression whose evaluation is deferred
+    def __compile_lazy_expr(self, expr_ast):
+        if expr_ast.elem_type in BytecodeCompiler.LITERAL_NODES:
+            self.__compile_expr(expr_ast)
+            return
+
+        if expr_ast.elem_type == InterpreterBase.VAR_NODE and self.__local(expr_ast) is not None:
+            # passed along as is, evaluated or not: a LazyValue is its own memo cell
+            self.code.emit(LOAD_VAR_LAZY, self.__local(expr_ast))
+            return
+
+        # give each distinct variable read by the expression an index in the thunk's locals
+        captured = []
+        thunk_addresses = {}
+        for var_ast in self.resolver.free_vars(expr_ast):
+            index = self.__local(var_ast)
+            if index not in captured:
+                captured.append(index)
+            thunk_addresses[id(var_ast)] = captured.index(index)
+        outer_code, outer_addresses = self.code, self.thunk_addresses
+        self.code, self.thunk_addresses = Code(outer_code.name), thunk_addresses
+        self.code.num_locals = len(captured)
+        self.__compile_expr(expr_ast)
+        self.code.emit(THUNK_RETURN)
+        thunk_code = self.code
+        self.code, self.thunk_addresses = outer_code, outer_addresses
+
+        self.code.emit(MAKE_THUNK, (expr_ast, thunk_code, captured))
+
+    # emits code that pushes the evaluated value of an expression
+    def __compile_expr(self, expr_ast):
+        code = self.code
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.NIL_NODE:
+            code.emit(LOAD_CONST, BytecodeCompiler.NIL_VALUE)
+        elif kind == InterpreterBase.INT_NODE:
+            code.emit(LOAD_CONST, int_value(expr_ast.val))
+        elif kind == InterpreterBase.STRING_NODE:
+            code.emit(LOAD_CONST, Value(Type.STRING, expr_ast.val))
+        elif kind == InterpreterBase.BOOL_NODE:
+            code.emit(LOAD_CONST, bool_value(expr_ast.val))
+        elif kind == InterpreterBase.VAR_NODE:
+            index = self.__local(expr_ast)
+            if index is None:
+                code.emit(FAIL, (ErrorType.NAME_ERROR, f"Variable {expr_ast.name} not found", expr_ast.line_num))
+            else:
+                code.emit(LOAD_VAR, index)
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__compile_call(expr_ast)
+            code.emit(FORCE)
+        elif kind == "||" or kind == "&&":
+            # document that all binary operations must be evaluated from left to right when they are evaluated
+            self.__compile_expr(expr_ast.op1)
+            code.emit(LOGICAL_CHECK, (kind, expr_ast.line_num))
+            short_circuit = code.emit(SHORT_CIRCUIT)
+            self.__compile_expr(expr_ast.op2)
+            code.emit(LOGICAL_CHECK, (kind, expr_ast.line_num))
+            code.patch(short_circuit, (kind == "||", code.next_index()))
+        elif kind in BytecodeCompiler.BIN_OPS:
+            self.__compile_expr(expr_ast.op1)
+            self.__compile_expr(expr_ast.op2)
+            code.emit(BINARY, [kind, None, None, None, expr_ast.line_num])
+        elif kind == InterpreterBase.NEG_NODE:
+            self.__compile_expr(expr_ast.op1)
+            code.emit(UNARY, (kind, Type.INT, lambda x: int_value(-1 * x), expr_ast.line_num))
+        elif kind == InterpreterBase.NOT_NODE:
+            self.__compile_expr(expr_ast.op1)
+            code.emit(UNARY, (kind, Type.BOOL, lambda x: bool_value(not x), expr_ast.line_num))
+        else:
+            code.emit(LOAD_CONST, None)
@@ -1,6 +1,8 @@
 class Element:
     def __init__(self, elem_type, **kwargs):
         self.elem_type = elem_type
+        self.line_num = None  # position in the source, set by the parser
+        self.col_num = None
         self.dict = {}
         for key, value in kwargs.items():
             self.dict[key] = value
@@ -1,92 +1,55 @@
-import copy
-
 import type_valuev4
 
-# The EnvironmentManager class keeps a mapping between each variable name (aka symbol)
-# in a brewin program and the Value object, which stores a type, and a value.
+# The EnvironmentManager class keeps a mapping between each variable in a brewin program
+# and the Value object, which stores a type, and a value.
+#
+# Variables are addressed lexically (see resolver_v4.py): each function's environment is a
+# list of blocks, and each block is a flat list of slots, so a variable with address
+# (depth, slot) lives at environment[-1][depth][slot].
 class EnvironmentManager:
     def __init__(self):
         self.environment = []
 
-    # returns a VariableDef object
-    def get(self, symbol):
-        cur_func_env = self.environment[-1]
-        for env in reversed(cur_func_env):
-            if symbol in env:
-                return env[symbol]
-
-        return None
+    # returns a Value object
+    def get(self, depth, slot):
+        return self.environment[-1][depth][slot]
 
-    def set(self, symbol, value):
-        cur_func_env = self.environment[-1]
-        for env in reversed(cur_func_env):
-            if symbol in env:
-                env[symbol] = value
-                return True
+    def set(self, depth, slot, value):
+        self.environment[-1][depth][slot] = value
 
-        return False
+    # used when we enter a new function - args is the block holding the parameters.
+    # Also used for lazy evaluation, where args holds the bindings captured by the thunk
+    def push_func(self, args):
+        self.environment.append([args])
 
-    # create a new symbol in the top-most environment, regardless of whether that symbol exists
-    # in a lower environment
-    def create(self, symbol, value):
+    def push_block(self, num_slots):
         cur_func_env = self.environment[-1]
-        if symbol in cur_func_env[-1]:   # symbol already defined in current scope
-            return False
-        cur_func_env[-1][symbol] = value
-        return True
-
-    # used when we enter a new function - start with empty dictionary to hold parameters.
-    def push_func(self, func_env = None):
-        if func_env is None:
-            self.environment.append([{}])  # [[...]] -> [[...], [{}]]
-        else:
-            self.environment.append(func_env) # used for lazy evaluation
-
-    def push_block(self):
-        cur_func_env = self.environment[-1]
-        cur_func_env.append({})  # [[...],[{....}] -> [[...],[{...}, {}]]
+        cur_func_env.append([None] * num_slots)  # [[...],[...]] -> [[...],[...],[None, ...]]
 
+    # used when we exit a nested block to discard the environment for that block
     def pop_block(self):
         cur_func_env = self.environment[-1]
         cur_func_env.pop() 
 
-    # used when we exit a nested block to discard the environment for that block
     def pop_func(self):
         self.environment.pop()
 
-    # return a new environment that only includes the top function's environment/in-scope variables
-    def get_top_env(self):
-        c = self.__env_copy(self.environment[-1])
-        #print("ENV: ")
-        #self.print_env(c)
-        return c
-
-    def __env_copy(self, top_level_env):
-        new_env = []
-        for d in top_level_env:
-            new_env.append(d.copy())
-        return new_env
-    
-    # write a function to recursively print the environment
-    def print_env(self, env):
-        def print_recursive(obj, indent=""):
-            if isinstance(obj, dict):
-                for key, value in obj.items():
-                    print(f"{indent}{key}:")
-                    print_recursive(value, indent + "  ")
-            elif isinstance(obj, list):
-                for item in obj:
-                    print_recursive(item, indent + "  ")
-            elif isinstance(obj, type_valuev4.LazyValue):
-                print(f"{indent}LazyValue: ")    
-                print_recursive(obj.top_env, indent + "  ")
-            elif isinstance(obj, type_valuev4.Value):
-                print(f"{indent}{obj.type()}: {obj.value()}")
+    # prints a function's environment (by default the current one): each slot's (depth, slot)
+    # address and its value. An unevaluated LazyValue is shown with the bindings it captured
+    def print_env(self, env=None):
+        def print_value(value, indent):
+            if value is None:
+                print(f"{indent}(not yet defined)")
+            elif isinstance(value, type_valuev4.LazyValue) and not value.evaluated():
+                print(f"{indent}LazyValue capturing:")
+                for captured in value.top_env:
+                    print_value(captured, indent + "  ")
             else:
-                print(f"---{indent}{obj}")
-
-        for e in env:
-            for k, v in e.items():
-                print(f"{k}:")
-                print_recursive(v, "  ")
-        
+                print(f"{indent}{value.type()}: {value.value()}")
+
+        if env is None:
+            env = self.environment[-1]
+        for depth, block in enumerate(env):
+            for slot, value in enumerate(block):
+                print(f"({depth}, {slot}):")
+                print_value(value, "  ")
@@ -1,4 +1,7 @@
 # Base class for our interpreter
+import hashlib
+import os
+from collections import deque
 from enum import Enum
 
 
@@ -9,6 +12,184 @@ class ErrorType(Enum):
     # Add others here
 
 
+# Output sinks decide what happens to the lines a program outputs, besides being printed
+# when console_output is on. ListSink, the default, keeps every line for get_output(); the
+# others keep O(1) memory however much the program prints. Use one with set_output_sink().
+# Every sink is an OutputSink and overrides the methods it needs
+class OutputSink:
+    def write(self, line):
+        pass
+
+    # the lines get_output() returns; sinks that don't keep them return none
+    def lines(self):
+        return []
+
+    # called before the interpreter runs another program
+    def reset(self):
+        pass
+
+    # writes out any lines the sink still holds back
+    def flush(self):
+        pass
+
+
+class ListSink(OutputSink):
+    def __init__(self):
+        self.log = []
+
+    def write(self, line):
+        self.log.append(line)
+
+    def lines(self):
+        return self.log
+
+    def reset(self):
+        self.log = []
+
+
+# keeps only the last capacity lines
+class RingBufferSink(OutputSink):
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.log = deque(maxlen=capacity)
+
+    def write(self, line):
+        self.log.append(line)
+
+    def lines(self):
+        return list(self.log)
+
+    def reset(self):
+        self.log = deque(maxlen=self.capacity)
+
+
+# keeps only the number of lines and a digest of them (each line followed by a newline)
+class HashingSink(OutputSink):
+    def __init__(self, algorithm="sha256"):
+        self.algorithm = algorithm
+        self.reset()
+
+    def write(self, line):
+        self.digest.update(f"{line}\n".encode())
+        self.line_count += 1
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+    def reset(self):
+        self.digest = hashlib.new(self.algorithm)
+        self.line_count = 0
+
+
+# writes lines to a file descriptor (or file object) in chunks of about buffer_size bytes;
+# the rest is written by flush(), which InterpreterBase.finish() and reset() call
+class FileSink(OutputSink):
+    def __init__(self, fd, buffer_size=65536):
+        self.file = fd  # keeps a file object open for as long as this uses its descriptor
+        self.fd = fd if isinstance(fd, int) else fd.fileno()
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, line):
+        line = f"{line}\n"
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    # the lines already output can't be taken back, so the buffered ones are written too
+    def reset(self):
+        self.flush()
+
+    def flush(self):
+        data = "".join(self.buffer).encode()
+        while data:
+            data = data[os.write(self.fd, data):]
+        self.buffer = []
+        self.buffered = 0
+
+
+# Input providers supply the values inputi()/inputs() read, one line each, and return None
+# once there are no more. ConsoleInput (the default) and ListInput (used when the interpreter
+# is given an inp list) behave as get_input() always has; StreamInput and IteratorInput read
+# lazily, so a program can consume more input than fits in memory. Use one with
+# set_input_provider().
+class ConsoleInput:
+    def read(self):
+        return input()
+
+    def reset(self):
+        pass
+
+
+class ListInput:
+    def __init__(self, values):
+        self.values = values
+        self.reset()
+
+    def read(self):
+        if self.cursor < len(self.values):
+            value = self.values[self.cursor]
+            self.cursor += 1
+            return value
+        return None
+
+    def reset(self):
+        self.cursor = 0
+
+
+# reads lines from a file descriptor (or file object, e.g. a pipe) in chunks of buffer_size
+# bytes, so only one chunk's worth of lines is held at a time. Can't be rewound by reset()
+class StreamInput:
+    def __init__(self, fd, buffer_size=65536):
+        self.file = fd  # keeps a file object open for as long as this uses its descriptor
+        self.fd = fd if isinstance(fd, int) else fd.fileno()
+        self.buffer_size = buffer_size
+        self.lines = deque()
+        self.partial = b""  # the start of a line whose end hasn't been read yet
+        self.at_eof = False
+
+    def read(self):
+        while not self.lines:
+            if self.at_eof:
+                return None
+            self.fill()
+        return self.lines.popleft()
+
+    def fill(self):
+        data = os.read(self.fd, self.buffer_size)
+        if not data:
+            self.at_eof = True
+            if self.partial:
+                self.lines.append(self.partial.decode())
+            return
+        data = self.partial + data
+        end = data.rfind(b"\n")
+        if end == -1:
+            self.partial = data
+            return
+        self.partial = data[end + 1:]
+        self.lines.extend(data[:end].decode().split("\n"))
+
+    def reset(self):
+        pass
+
+
+# reads values from any iterable, such as a generator; each is converted with str().
+# Can't be rewound by reset()
+class IteratorInput:
+    def __init__(self, values):
+        self.values = iter(values)
+
+    def read(self):
+        value = next(self.values, None)
+        return None if value is None else str(value)
+
+    def reset(self):
+        pass
+
+
 class InterpreterBase:
     # AST node types
     PROGRAM_NODE = "program"
@@ -43,12 +224,14 @@ class InterpreterBase:
     def __init__(self, console_output=True, inp=None):
         self.console_output = console_output
         self.inp = inp  # if not none, then read input from passed-in list
+        self.input_provider = ListInput(inp) if inp else ConsoleInput()
+        self.output_sink = ListSink()
         self.reset()
 
     # Call to reset I/O for another run of the program
     def reset(self):
-        self.output_log = []
-        self.input_cursor = 0
+        self.output_sink.reset()
+        self.input_provider.reset()
         self.error_type = None
         self.error_line = None
 
@@ -56,15 +239,17 @@ class InterpreterBase:
     def run(self, program):
         pass
 
+    # run() should call this once the program is done, including when it ends in an error,
+    # so that an output sink that holds lines back (e.g. FileSink) writes them out
+    def finish(self):
+        self.output_sink.flush()
+
     def get_input(self):
-        if not self.inp:
-            return input()  # Get input from keyboard if not input list provided
+        return self.input_provider.read()
 
-        if self.input_cursor < len(self.inp):
-            cur_input = self.inp[self.input_cursor]
-            self.input_cursor += 1
-            return cur_input
-        return None
+    # replaces where input comes from (see ConsoleInput)
+    def set_input_provider(self, provider):
+        self.input_provider = provider
 
     # students must call this for any errors that they run into
     def error(self, error_type, description=None, line_num=None):
@@ -83,10 +268,14 @@ class InterpreterBase:
     def output(self, v):
         if self.console_output:
             print(v)
-        self.output_log.append(v)
+        self.output_sink.write(v)
+
+    # replaces where output lines go (see ListSink); get_output() returns what the sink kept
+    def set_output_sink(self, sink):
+        self.output_sink = sink
 
     def get_output(self):
-        return self.output_log
+        return self.output_sink.lines()
 
     def get_error_type_and_line(self):
         return self.error_type, self.error_line
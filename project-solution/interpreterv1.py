@@ -22,11 +22,14 @@ class Interpreter(InterpreterBase):
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
-        ast = parse_program(program)
-        self.__set_up_function_table(ast)
-        main_func = self.__get_func_by_name("main")
-        self.env = EnvironmentManager()
-        self.__run_statements(main_func.get("statements"))
+        try:
+            ast = parse_program(program)
+            self.__set_up_function_table(ast)
+            main_func = self.__get_func_by_name("main")
+            self.env = EnvironmentManager()
+            self.__run_statements(main_func.get("statements"))
+        finally:
+            self.finish()
 
     def __set_up_function_table(self, ast):
         self.func_name_to_ast = {}
@@ -31,10 +31,13 @@ class Interpreter(InterpreterBase):
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
-        ast = parse_program(program)
-        self.__set_up_function_table(ast)
-        self.env = EnvironmentManager()
-        self.__call_func_aux("main", [])
+        try:
+            ast = parse_program(program)
+            self.__set_up_function_table(ast)
+            self.env = EnvironmentManager()
+            self.__call_func_aux("main", [])
+        finally:
+            self.finish()
 
     def __set_up_function_table(self, ast):
         self.func_name_to_ast = {}
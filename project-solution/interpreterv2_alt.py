@@ -10,22 +10,25 @@ class Interpreter(InterpreterBase):
         self.bops = {'+', '-', '*', '/', '==', '!=', '>', '>=', '<', '<=', '||', '&&'}
 
     def run(self, program):
-        ast = parse_program(program)
+        try:
+            ast = parse_program(program)
 
-        for func in ast.get('functions'):
-            self.funcs[(func.get('name'),len(func.get('args')))] = func
+            for func in ast.get('functions'):
+                self.funcs[(func.get('name'),len(func.get('args')))] = func
 
-        main_key = None
+            main_key = None
 
-        for k in self.funcs:
-            if k[0] == 'main':
-                main_key = k
-                break
+            for k in self.funcs:
+                if k[0] == 'main':
+                    main_key = k
+                    break
 
-        if main_key is None:
-            super().error(ErrorType.NAME_ERROR, '')
+            if main_key is None:
+                super().error(ErrorType.NAME_ERROR, '')
 
-        self.run_fcall(self.funcs[main_key])
+            self.run_fcall(self.funcs[main_key])
+        finally:
+            self.finish()
 
     def run_vardef(self, statement):
         name = statement.get('name')
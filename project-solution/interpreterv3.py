@@ -2,17 +2,25 @@ import copy
 from enum import Enum
 
 from brewparse import parse_program
+from bytecode_v3 import BytecodeCompiler
 from env_v3 import EnvironmentManager
 from intbase import InterpreterBase, ErrorType
 from type_valuev3 import *
+from vm_v3 import VM
 
 
 class ExecStatus(Enum):
     CONTINUE = 1
     RETURN = 2
+    TAIL_CALL = 3  # return f(...): the value is (f's ast, its args), for the caller to call in our place
 
 
 # Main interpreter class
+#
+# With use_vm=True, functions are compiled to bytecode instead (bytecode_v3.py) and run by
+# a stack-based VM (vm_v3.py) that keeps Brewin frames on its own stack rather than Python's,
+# so deep (non-tail) recursion doesn't hit Python's recursion limit. It is there for that
+# depth, not for speed; the tree walker is about as fast.
 class Interpreter(InterpreterBase):
     # constants
     NIL_VALUE = TypeManager.create_value(InterpreterBase.NIL_DEF)
@@ -21,9 +29,10 @@ class Interpreter(InterpreterBase):
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    def __init__(self, console_output=True, inp=None, trace_output=False, use_vm=False):
         super().__init__(console_output, inp)
         self.trace_output = trace_output
+        self.use_vm = use_vm
         self.__setup_ops()
         self.__call_stack = []
         self.type_manager = TypeManager()
@@ -34,10 +43,18 @@ class Interpreter(InterpreterBase):
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
-        ast = parse_program(program)
-        self.__set_up_struct_table(ast)
-        self.__set_up_function_table(ast)
-        self.__call_func_aux("main", [])
+        try:
+            ast = parse_program(program)
+            self.__set_up_struct_table(ast)
+            self.__set_up_function_table(ast)
+            if self.use_vm:
+                self.bytecode_compiler = BytecodeCompiler(self.func_name_to_ast)
+                self.func_code = {}  # (name, num_params) -> bytecode, filled in on first call
+                VM(self, self.__get_vm_code).run(self.__get_func_by_name("main", 0))
+                return
+            self.__call_func_aux("main", [])
+        finally:
+            self.finish()
 
     def __set_up_struct_table(self, ast):
         struct_asts = ast.get("structs")
@@ -90,6 +107,13 @@ class Interpreter(InterpreterBase):
             )
         return candidate_funcs[num_params]
 
+    # returns the bytecode for a user function, compiling it on first use
+    def __get_vm_code(self, func_ast):
+        key = (func_ast.get("name"), len(func_ast.get("args")))
+        if key not in self.func_code:
+            self.func_code[key] = self.bytecode_compiler.compile_func(func_ast)
+        return self.func_code[key]
+
     def __get_return_type_of_current_function(self):
       current_func = self.__call_stack[-1]
       return current_func.get("return_type")
@@ -100,7 +124,7 @@ class Interpreter(InterpreterBase):
             if self.trace_output:
                 print(statement)
             status, return_val = self.__run_statement(statement)
-            if status == ExecStatus.RETURN:
+            if status != ExecStatus.CONTINUE:
                 self.env.pop_block()
                 return (status, return_val)
 
@@ -130,6 +154,11 @@ class Interpreter(InterpreterBase):
         actual_args = call_node.get("args")
         return self.__call_func_aux(func_name, actual_args)
 
+    # A return of a user function call is a tail call: __do_return evaluates the call's
+    # arguments, then hands the call back to us as a TAIL_CALL instead of making it, so it
+    # runs in this loop once the caller's activation record is gone. Tail-recursive programs
+    # therefore run in constant Python stack depth. The value each function returns is still
+    # checked against and coerced to its return type, innermost first, as if it had returned
     def __call_func_aux(self, func_name, actual_args):
         if func_name == "print":
             return self.__call_print(actual_args)
@@ -137,39 +166,58 @@ class Interpreter(InterpreterBase):
             return self.__call_input(func_name, actual_args)
 
         func_ast = self.__get_func_by_name(func_name, len(actual_args))
-        self.__call_stack.append(func_ast)
+        args = self.__eval_args(func_ast, actual_args)
+        pending_return_types = []  # of the functions that tail called the one running, outermost first
+        while True:
+            self.__call_stack.append(func_ast)
+            return_type = self.__get_return_type_of_current_function()
+            # create the new activation record
+            self.env.push_func()
+            # and add the formal arguments to the activation record
+            for arg_name, variable in args.items():
+              self.env.create(arg_name, variable)
+            exec_status, return_val = self.__run_statements(func_ast.get("statements"))
+            self.env.pop_func()
+            self.__call_stack.pop()
+            if exec_status != ExecStatus.TAIL_CALL:
+                break
+            # checking a return value twice against the same type changes nothing, so
+            # self-recursion keeps this list short
+            if not pending_return_types or pending_return_types[-1] != return_type:
+                pending_return_types.append(return_type)
+            func_ast, args = return_val
+
+        if exec_status != ExecStatus.RETURN:
+            return_val = self.type_manager.create_default_value(return_type)  # DOCUMENT no return statement returns default value
+        for return_type in reversed(pending_return_types):
+            return_val = self.check_return_value(return_type, copy.copy(return_val))
+        return return_val
+
+    # evaluates the actual parameters of a call and associates them with the formal parameter names
+    def __eval_args(self, func_ast, actual_args):
         formal_args = func_ast.get("args")
-        return_type = self.__get_return_type_of_current_function()
         if len(actual_args) != len(formal_args):
             super().error(
                 ErrorType.NAME_ERROR,
                 f"Function {func_ast.get('name')} with {len(actual_args)} args not found",
             )
 
-        # first evaluate all of the actual parameters and associate them with the formal parameter names
         args = {}
         for formal_ast, actual_ast in zip(formal_args, actual_args):
             result = copy.copy(self.__eval_expr(actual_ast))
-            arg_name = formal_ast.get("name")
-            arg_type = formal_ast.get("var_type")
-            if not self.__compatible_types_for_assignment(Variable(arg_type), result):
-                super().error(
-                    ErrorType.TYPE_ERROR,
-                    f"Type mismatch on formal parameter {arg_name}"
-                )
-            args[arg_name] = Variable(arg_type, self.__coerce(arg_type, result))
-
-        # then create the new activation record 
-        self.env.push_func()
-        # and add the formal arguments to the activation record
-        for arg_name, variable in args.items():
-          self.env.create(arg_name, variable)
-        exec_status, return_val = self.__run_statements(func_ast.get("statements"))
-        self.env.pop_func()
-        self.__call_stack.pop()
-        if exec_status == ExecStatus.RETURN:
-            return return_val
-        return self.type_manager.create_default_value(return_type)  # DOCUMENT no return statement returns default value
+            args[formal_ast.get("name")] = self.bind_arg(formal_ast, result)
+        return args
+
+    # returns the Variable that holds an actual parameter's value for its formal parameter
+    def bind_arg(self, formal_ast, value_obj):
+        arg_name = formal_ast.get("name")
+        arg_type = formal_ast.get("var_type")
+        if not self.__compatible_types_for_assignment(Variable(arg_type), value_obj):
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Type mismatch on formal parameter {arg_name}"
+            )
+        return Variable(arg_type, self.__coerce(arg_type, value_obj))
 
     def __coerce(self, target_type, value_obj):
         if target_type == Type.BOOL and value_obj.type() == Type.INT:
@@ -185,22 +233,27 @@ class Interpreter(InterpreterBase):
         output = ""
         for arg in args:
             result = self.__eval_expr(arg)  # result is a Value object
-            if result.type() == Type.VOID:
-                super().error(ErrorType.TYPE_ERROR, "Void not allowed as argument")
+            self.check_builtin_arg(result)
             output = output + TypeManager.get_printable(result)  # DOCUMENT need to be able to print "nil" now, undefined for a struct
         super().output(output)
         return Interpreter.VOID_VALUE
 
+    def check_builtin_arg(self, value_obj):
+        if value_obj.type() == Type.VOID:
+            super().error(ErrorType.TYPE_ERROR, "Void not allowed as argument")
+
     def __call_input(self, name, args):
         if args is not None and len(args) == 1:
             result = self.__eval_expr(args[0])
-            if result.type() == Type.VOID:
-                super().error(ErrorType.TYPE_ERROR, "Void not allowed as argument")
+            self.check_builtin_arg(result)
             super().output(TypeManager.get_printable(result))
         elif args is not None and len(args) > 1:
             super().error(
                 ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
             )
+        return self.read_input(name)
+
+    def read_input(self, name):
         inp = super().get_input()
         if name == "inputi":
             return Value(Type.INT, int(inp))
@@ -209,8 +262,11 @@ class Interpreter(InterpreterBase):
 
     def __assign(self, assign_ast):
         var_name = assign_ast.get("name")
-        lhs_var = self.__get_variable(var_name)
+        lhs_var = self.get_variable(var_name)
         rhs_val = self.__eval_expr(assign_ast.get("expression"))
+        self.assign_value(lhs_var, rhs_val)
+
+    def assign_value(self, lhs_var, rhs_val):
         if not self.__compatible_types_for_assignment(lhs_var, rhs_val): # DOCUMENT
             super().error(
                 ErrorType.TYPE_ERROR, f"Type mismatch {lhs_var.type()} vs {rhs_val.type()} in assignment"
@@ -224,7 +280,7 @@ class Interpreter(InterpreterBase):
 
         lhs_var.set_value(rhs_val)
 
-    def __get_variable(self, var_name):
+    def get_variable(self, var_name):
         split_var = var_name.split(".")
         base_var = self.env.get(split_var[0])
         if base_var is None:
@@ -254,6 +310,9 @@ class Interpreter(InterpreterBase):
     def __var_def(self, var_ast):
         var_name = var_ast.get("name")
         var_type = var_ast.get("var_type")  # DOCUMENT change in AST and in syntax
+        self.define_var(var_name, var_type)
+
+    def define_var(self, var_name, var_type):
         default_value = self.type_manager.create_default_value(var_type) # DOCUMENT: default value for defined variables
         variable = Variable(var_type, default_value)
         if default_value is None or not self.type_manager.valid_var_type(var_type):
@@ -276,12 +335,12 @@ class Interpreter(InterpreterBase):
             return Value(Type.BOOL, expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.VAR_NODE:
             var_name = expr_ast.get("name")
-            variable = self.__get_variable(var_name)  # error checks
+            variable = self.get_variable(var_name)  # error checks
             return variable.value()
         if expr_ast.elem_type == InterpreterBase.FCALL_NODE:
             return self.__call_func(expr_ast)
         if expr_ast.elem_type == InterpreterBase.NEW_NODE:
-            return self.__new_struct(expr_ast)
+            return self.new_struct(expr_ast.get("var_type"))
         if expr_ast.elem_type in Interpreter.BIN_OPS:
             return self.__eval_op(expr_ast)
         if expr_ast.elem_type == Interpreter.NEG_NODE:
@@ -289,8 +348,7 @@ class Interpreter(InterpreterBase):
         if expr_ast.elem_type == Interpreter.NOT_NODE:
             return self.__eval_unary_not(expr_ast)
 
-    def __new_struct(self, new_ast):
-        var_type = new_ast.get("var_type")
+    def new_struct(self, var_type):
         default_value = self.type_manager.new_struct_value(var_type)
         if default_value is None:
             super().error(
@@ -302,23 +360,25 @@ class Interpreter(InterpreterBase):
     def __eval_op(self, arith_ast):
         left_value_obj = self.__eval_expr(arith_ast.get("op1"))
         right_value_obj = self.__eval_expr(arith_ast.get("op2"))
-       
+        return self.eval_binary(arith_ast.elem_type, left_value_obj, right_value_obj)
+
+    def eval_binary(self, oper, left_value_obj, right_value_obj):
         ltype = left_value_obj.type() 
         rtype = right_value_obj.type() 
         if ltype == rtype and ltype in self.op_to_lambda:
-            f = self.op_to_lambda[ltype].get(arith_ast.elem_type)
+            f = self.op_to_lambda[ltype].get(oper)
             if f is not None:
                 return f(left_value_obj, right_value_obj)
 
-        if arith_ast.elem_type in ["==", "!="]:
-            return self.__eval_compare(arith_ast.elem_type, left_value_obj, right_value_obj)
+        if oper in ["==", "!="]:
+            return self.__eval_compare(oper, left_value_obj, right_value_obj)
 
-        if arith_ast.elem_type in ["||", "&&"]:
-            return self.__eval_and_or(arith_ast.elem_type, left_value_obj, right_value_obj)
+        if oper in ["||", "&&"]:
+            return self.__eval_and_or(oper, left_value_obj, right_value_obj)
 
         super().error(
             ErrorType.TYPE_ERROR,
-            f"Incompatible operator {arith_ast.elem_type} for types {left_value_obj.type()} and {right_value_obj.type()}",
+            f"Incompatible operator {oper} for types {left_value_obj.type()} and {right_value_obj.type()}",
         )
 
     def __eval_and_or(self, oper, obj1, obj2):
@@ -422,22 +482,28 @@ class Interpreter(InterpreterBase):
 
     def __eval_unary_neg(self, arith_ast):
         value_obj = self.__eval_expr(arith_ast.get("op1"))
+        return self.eval_neg(arith_ast.elem_type, value_obj)
+
+    def eval_neg(self, oper, value_obj):
         if value_obj.type() != Type.INT:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
+                f"Incompatible type for {oper} operation",
             )
 
         return Value(Type.INT, -value_obj.value())
     
     def __eval_unary_not(self, arith_ast):
         value_obj = self.__eval_expr(arith_ast.get("op1"))
+        return self.eval_not(arith_ast.elem_type, value_obj)
+
+    def eval_not(self, oper, value_obj):
         val_type = value_obj.type()
 
         if val_type != Type.BOOL and val_type != Type.INT:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
+                f"Incompatible type for {oper} operation",
             )
 
         notted = Value(Type.BOOL, not self.__coerce(Type.BOOL, value_obj).value())
@@ -490,11 +556,7 @@ class Interpreter(InterpreterBase):
     def __do_if(self, if_ast):
         cond_ast = if_ast.get("condition")
         result = self.__eval_expr(cond_ast)
-        if result.type() != Type.BOOL and result.type() != Type.INT:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                "Incompatible type for if condition",
-            )
+        self.check_condition(result, "Incompatible type for if condition")
         if result.value():
             statements = if_ast.get("statements")
             status, return_val = self.__run_statements(statements)
@@ -507,6 +569,11 @@ class Interpreter(InterpreterBase):
 
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
+    # if and for conditions may be bools or ints (DOCUMENT)
+    def check_condition(self, result, description):
+        if result.type() != Type.BOOL and result.type() != Type.INT:
+            super().error(ErrorType.TYPE_ERROR, description)
+
     def __do_for(self, for_ast):
         init_ast = for_ast.get("init") 
         cond_ast = for_ast.get("condition")
@@ -516,15 +583,11 @@ class Interpreter(InterpreterBase):
         run_for = Interpreter.TRUE_VALUE
         while run_for.value():
             run_for = self.__eval_expr(cond_ast)  # check for-loop condition
-            if run_for.type() != Type.BOOL and run_for.type() != Type.INT:
-                super().error(
-                    ErrorType.TYPE_ERROR,
-                    "Incompatible type for for condition",
-                )
+            self.check_condition(run_for, "Incompatible type for for condition")
             if run_for.value():
                 statements = for_ast.get("statements")
                 status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.RETURN:
+                if status != ExecStatus.CONTINUE:
                     return status, return_val
 
                 self.__run_statement(update_ast)  # update counter variable
@@ -536,7 +599,14 @@ class Interpreter(InterpreterBase):
         func_ret_type = self.__get_return_type_of_current_function()
         if expr_ast is None:
             return (ExecStatus.RETURN, self.type_manager.create_default_value(func_ret_type)) # DOCUMENT return; as returning default value
+        if expr_ast.elem_type == InterpreterBase.FCALL_NODE and expr_ast.get("name") not in ("print", "inputi", "inputs"):
+            actual_args = expr_ast.get("args")
+            func_ast = self.__get_func_by_name(expr_ast.get("name"), len(actual_args))
+            return (ExecStatus.TAIL_CALL, (func_ast, self.__eval_args(func_ast, actual_args)))
         value_obj = copy.copy(self.__eval_expr(expr_ast))  # DOCUMENT
+        return (ExecStatus.RETURN, self.check_return_value(func_ret_type, value_obj))
+
+    def check_return_value(self, func_ret_type, value_obj):
         if value_obj.type() == Type.VOID:
             super().error(
                 ErrorType.TYPE_ERROR,
@@ -547,4 +617,4 @@ class Interpreter(InterpreterBase):
                 ErrorType.TYPE_ERROR,
                 f"Returned value's type {value_obj.type()} is inconsistent with function's return type {func_ret_type}"
             )
-        return (ExecStatus.RETURN, self.__coerce(func_ret_type, value_obj)) # DOCUMENT all coercions!
+        return self.__coerce(func_ret_type, value_obj) # DOCUMENT all coercions!
@@ -12,46 +12,49 @@ class Interpreter(InterpreterBase):
         self.bops = {'+', '-', '*', '/', '==', '!=', '>', '>=', '<', '<=', '||', '&&'}
 
     def run(self, program):
-        ast = parse_program(program)
+        try:
+            ast = parse_program(program)
 
-        for func in ast.get('functions'):
-            self.funcs[(func.get('name'),len(func.get('args')))] = func
+            for func in ast.get('functions'):
+                self.funcs[(func.get('name'),len(func.get('args')))] = func
 
-        for struct in ast.get('structs'):
-            name = struct.get('name')
+            for struct in ast.get('structs'):
+                name = struct.get('name')
 
-            self.structs[name] = {'t':struct.get('name'), 'f':None}
+                self.structs[name] = {'t':struct.get('name'), 'f':None}
 
-            fields = {}
+                fields = {}
 
-            # if repeating field names, take the last one (undefined)
-            for f in struct.get('fields'):
-                n, t = f.get('name'), f.get('var_type')
+                # if repeating field names, take the last one (undefined)
+                for f in struct.get('fields'):
+                    n, t = f.get('name'), f.get('var_type')
 
-                if t == 'int':
-                    fields[n] = 0
-                elif t == 'bool':
-                    fields[n] = False
-                elif t == 'string':
-                    fields[n] = ''
-                elif t in self.structs:
-                    fields[n] = {'t':t, 'f':None}
-                else:
-                    super().error(ErrorType.TYPE_ERROR, '')
+                    if t == 'int':
+                        fields[n] = 0
+                    elif t == 'bool':
+                        fields[n] = False
+                    elif t == 'string':
+                        fields[n] = ''
+                    elif t in self.structs:
+                        fields[n] = {'t':t, 'f':None}
+                    else:
+                        super().error(ErrorType.TYPE_ERROR, '')
 
-            self.structs[name]['f'] = fields
+                self.structs[name]['f'] = fields
 
-        main_key = None
+            main_key = None
 
-        for k in self.funcs:
-            if k[0] == 'main':
-                main_key = k
-                break
+            for k in self.funcs:
+                if k[0] == 'main':
+                    main_key = k
+                    break
 
-        if main_key is None:
-            super().error(ErrorType.NAME_ERROR, '')
+            if main_key is None:
+                super().error(ErrorType.NAME_ERROR, '')
 
-        self.run_fcall(self.funcs[main_key])
+            self.run_fcall(self.funcs[main_key])
+        finally:
+            self.finish()
 
     def run_vardef(self, statement):
         name = statement.get('name')
@@ -1,477 +1,738 @@
-import copy
-from enum import Enum
-
 from brewparse import parse_program
+from bytecode_v4 import BytecodeCompiler
 from env_v4 import EnvironmentManager
 from intbase import InterpreterBase, ErrorType
-from type_valuev4 import Type, Value, LazyValue, create_value, get_printable
+from nodes import make_node
+from optimizer_v4 import optimize
+from resolver_v4 import Resolver
+from strictness_v4 import leading_vars, strict_assignments
+from type_valuev4 import Type, Value, LazyValue, bool_value, create_value, get_printable, int_value
+from vm_v4 import VM
 
 
-class ExecStatus(Enum):
-    CONTINUE = 1
-    RETURN = 2
-    EXCEPTION = 3
+# A Brewin exception (from raise or div0) on its way to a try statement that catches it;
+# value_obj is the exception's string Value
+class BrewinException(Exception):
+    def __init__(self, value_obj):
+        self.value_obj = value_obj
 
 
 # Main interpreter class
+#
+# Rather than re-dispatching on elem_type strings for every node each time it runs, the
+# interpreter compiles each function's AST into nested Python closures the first time the
+# function is called. Statement closures take no arguments and return None, or the Value
+# being returned if the statement returns from the function; expression closures return
+# their fully evaluated Value. A Brewin exception is raised as a BrewinException, so the
+# code in between doesn't check for it and blocks and calls pop their environments in a
+# finally.
+#
+# With use_vm=True, functions are compiled to bytecode instead (bytecode_v4.py) and run by
+# a stack-based VM (vm_v4.py), with the same semantics. That is a deep-recursion mode, not a
+# speedup: the VM keeps Brewin frames off Python's stack, so non-tail recursion isn't limited
+# to a few hundred calls, but it runs programs at about the same speed as the closures.
 class Interpreter(InterpreterBase):
     # constants
     NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
     TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
+    FALSE_VALUE = create_value(InterpreterBase.FALSE_DEF)
     DIV_ZERO = Value(Type.STRING, "div0")
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    STATEMENT_NAMES = {"=": "assign"}  # how the profiler names statements, if not by elem_type
+    LITERAL_NODES = {
+        InterpreterBase.NIL_NODE,
+        InterpreterBase.INT_NODE,
+        InterpreterBase.STRING_NODE,
+        InterpreterBase.BOOL_NODE,
+    }
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    # profiler, a profiler_v4.Profiler, makes the interpreter report every function call,
+    # statement and thunk evaluation to it (not single expressions, see profiler_v4.py).
+    # Profiling instruments the compiled closures, so passing a profiler turns the VM off:
+    # a profiled program always runs on the closures, even with use_vm
+    def __init__(self, console_output=True, inp=None, trace_output=False, use_vm=False, profiler=None):
         super().__init__(console_output, inp)
         self.trace_output = trace_output
+        self.use_vm = use_vm and profiler is None
+        self.profiler = profiler
         self.__setup_ops()
+        self.__setup_compilers()
 
     # run a program that's provided in a string
     # usese the provided Parser found in brewparse.py to parse the program
-    # into an abstract syntax tree (ast)
+    # into an abstract syntax tree (ast) of compact typed nodes (nodes.py), then folds
+    # constants and prunes dead branches (optimizer_v4.py)
     def run(self, program):
-        ast = parse_program(program)
-        self.__set_up_function_table(ast)
-        self.env = EnvironmentManager()
-        status, result = self.__call_func_aux("main", [])
-        if status == ExecStatus.EXCEPTION:
+        try:
+            ast = optimize(parse_program(program, make_node))
+            self.__set_up_function_table(ast)
+            self.resolver = Resolver(ast)
+            self.thunk_addresses = None
+            if self.use_vm:
+                self.bytecode_compiler = BytecodeCompiler(self.resolver)
+                _, main_code = self.__get_vm_code("main", 0)
+                result = VM(self, self.__get_vm_code).run(main_code)
+                if result is not None:
+                    super().error(ErrorType.FAULT_ERROR, f"Exception {result.value()} not caught!")
+                return
+            self.env = EnvironmentManager()
+            try:
+                self.__call_func_aux("main", [])
+                return
+            except BrewinException as exception:
+                result = exception.value_obj
             super().error(ErrorType.FAULT_ERROR, f"Exception {result.value()} not caught!")
+        finally:
+            self.finish()
 
 
     def __set_up_function_table(self, ast):
         self.func_name_to_ast = {}
-        for func_def in ast.get("functions"):
-            func_name = func_def.get("name")
-            num_params = len(func_def.get("args"))
+        self.func_code = {}  # (name, num_params) -> compiled body, filled in on first call
+        self.node_counts = {}  # (function name, node kind) -> number of nodes labeled so far
+        for func_def in ast.functions:
+            func_name = func_def.name
+            num_params = len(func_def.args)
             if func_name not in self.func_name_to_ast:
                 self.func_name_to_ast[func_name] = {}
             self.func_name_to_ast[func_name][num_params] = func_def
 
-    def __get_func_by_name(self, name, num_params):
+    def __get_func_by_name(self, name, num_params, line_num=None):
         if name not in self.func_name_to_ast:
-            super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
+            super().error(ErrorType.NAME_ERROR, f"Function {name} not found", line_num)
         candidate_funcs = self.func_name_to_ast[name]
         if num_params not in candidate_funcs:
             super().error(
                 ErrorType.NAME_ERROR,
                 f"Function {name} taking {num_params} params not found",
+                line_num,
             )
         return candidate_funcs[num_params]
 
-    def __run_statements(self, statements):
-        self.env.push_block()
-        for statement in statements:
-            if self.trace_output:
-                print(statement)
-            status, return_val = self.__run_statement(statement)
-            if status == ExecStatus.RETURN or status == ExecStatus.EXCEPTION:
-                self.env.pop_block()
-                return (status, return_val)
-
-        self.env.pop_block()
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
-
-    def __run_statement(self, statement):
-        status = ExecStatus.CONTINUE
-        return_val = None
-        if statement.elem_type == InterpreterBase.FCALL_NODE:
-            status, return_val = self.__call_func(statement)
-        elif statement.elem_type == "=":
-            status, return_val = self.__assign(statement)
-        elif statement.elem_type == InterpreterBase.VAR_DEF_NODE:
-            self.__var_def(statement)
-        elif statement.elem_type == InterpreterBase.RETURN_NODE:
-            status, return_val = self.__do_return(statement)
-        elif statement.elem_type == InterpreterBase.RAISE_NODE:
-            status, return_val = self.__do_raise(statement)
-        elif statement.elem_type == Interpreter.IF_NODE:
-            status, return_val = self.__do_if(statement)
-        elif statement.elem_type == Interpreter.FOR_NODE:
-            status, return_val = self.__do_for(statement)
-        elif statement.elem_type == Interpreter.TRY_NODE:
-            status, return_val = self.__do_try(statement)
-
-        return (status, return_val)
-
-    def __call_func(self, call_node):
-        func_name = call_node.get("name")
-        actual_args = call_node.get("args")
-        status, return_val = self.__call_func_aux(func_name, actual_args)
-        if status == ExecStatus.EXCEPTION:
-            return (status, return_val)  # return_val is the exception type
-        if status == ExecStatus.RETURN:
-            status = ExecStatus.CONTINUE
-        return (status, return_val)
+    # returns (number of parameter slots, slot of each formal arg, compiled body) for a user
+    # function, compiling it on first use
+    def __get_func_code(self, name, num_params, line_num=None):
+        key = (name, num_params)
+        if key not in self.func_code:
+            func_ast = self.__get_func_by_name(name, num_params, line_num)
+            formal_args = func_ast.args
+            arg_slots = [self.resolver.address(formal_ast)[1] for formal_ast in formal_args]
+            self.compiling_func = name
+            self.strict = strict_assignments(func_ast.statements, self.resolver)
+            body = self.__compile_statements(func_ast.statements)
+            self.func_code[key] = (
+                self.resolver.block_size(formal_args),
+                arg_slots,
+                self.__profiled(body, "func", name, name),
+            )
+        return self.func_code[key]
+
+    # with a profiler, wraps compiled code so that each run of it is reported to the profiler
+    # as a run of a node of the given kind in the function being compiled; functions and
+    # thunks also get their own frame_name in the profiler's call stacks
+    def __profiled(self, run, kind, label, frame_name=None):
+        profiler = self.profiler
+        if profiler is None:
+            return run
+        key = (self.compiling_func, kind, label)
+
+        def run_profiled():
+            profiler.enter(key, frame_name)
+            try:
+                return run()
+            finally:
+                profiler.exit()
+
+        return run_profiled
+
+    # a name for a statement or lazy expression: its kind and source position, or if it has
+    # none, its kind and its order among the function's nodes of that kind
+    def __node_label(self, kind, node):
+        if node.line_num is not None:
+            return f"{kind} line {node.line_num}:{node.col_num}"
+        count = self.node_counts.get((self.compiling_func, kind), 0) + 1
+        self.node_counts[(self.compiling_func, kind)] = count
+        return f"{kind} #{count}"
+
+    # returns (slot of each formal arg, bytecode) for a user function, compiling it on first use
+    def __get_vm_code(self, name, num_params, line_num=None):
+        key = (name, num_params)
+        if key not in self.func_code:
+            func_ast = self.__get_func_by_name(name, num_params, line_num)
+            self.func_code[key] = self.bytecode_compiler.compile_func(func_ast)
+        return self.func_code[key]
 
     def __call_func_aux(self, func_name, actual_args):
         if func_name == "print":
-            return self.__call_print(actual_args)
+            return self.__compile_print(actual_args)()
         if func_name == "inputi" or func_name == "inputs":
-            return self.__call_input(func_name, actual_args)
-
-        func_ast = self.__get_func_by_name(func_name, len(actual_args))
-        formal_args = func_ast.get("args")
-        if len(actual_args) != len(formal_args):
-            super().error(
-                ErrorType.NAME_ERROR,
-                f"Function {func_ast.get('name')} with {len(actual_args)} args not found",
-            )
-
-        # first evaluate all of the actual parameters and associate them with the formal parameter names
-        args = {}
-        for formal_ast, actual_ast in zip(formal_args, actual_args):
-            status, actual_arg = self.__eval_expr(actual_ast)
-            if status == ExecStatus.EXCEPTION:
-                return (status, actual_arg)
-            result = copy.copy(actual_arg)
-            arg_name = formal_ast.get("name")
-            args[arg_name] = result
-
-        # then create the new activation record
-        self.env.push_func()
-        # and add the formal arguments to the activation record
-        for arg_name, value in args.items():
-          self.env.create(arg_name, value)
-        status, return_val = self.__run_statements(func_ast.get("statements"))
-        self.env.pop_func()
-        #print(f"call_func_aux: status: {status}, return_val: {return_val}")
-        return (status, return_val)
+            return self.__compile_input(func_name, actual_args)()
+        return self.__compile_user_call(func_name, actual_args)()
+
+    def __setup_compilers(self):
+        # elem_type dispatch happens once per node, at compile time
+        self.stmt_compilers = {
+            InterpreterBase.FCALL_NODE: self.__compile_call_stmt,
+            "=": self.__compile_assign,
+            InterpreterBase.VAR_DEF_NODE: self.__compile_var_def,
+            InterpreterBase.RETURN_NODE: self.__compile_return,
+            InterpreterBase.RAISE_NODE: self.__compile_raise,
+            InterpreterBase.IF_NODE: self.__compile_if,
+            InterpreterBase.FOR_NODE: self.__compile_for,
+            InterpreterBase.TRY_NODE: self.__compile_try,
+        }
+        self.expr_compilers = {
+            InterpreterBase.NIL_NODE: self.__compile_literal,
+            InterpreterBase.INT_NODE: self.__compile_literal,
+            InterpreterBase.STRING_NODE: self.__compile_literal,
+            InterpreterBase.BOOL_NODE: self.__compile_literal,
+            InterpreterBase.VAR_NODE: self.__compile_var,
+            InterpreterBase.FCALL_NODE: self.__compile_call_expr,
+            InterpreterBase.NEG_NODE: lambda expr_ast: self.__compile_unary(
+                expr_ast, Type.INT, lambda x: int_value(-1 * x)
+            ),
+            InterpreterBase.NOT_NODE: lambda expr_ast: self.__compile_unary(
+                expr_ast, Type.BOOL, lambda x: bool_value(not x)
+            ),
+            "||": self.__compile_logical,
+            "&&": self.__compile_logical,
+        }
+        for op in Interpreter.BIN_OPS - {"||", "&&"}:
+            self.expr_compilers[op] = self.__compile_op
+
+    def __compile_statements(self, statements):
+        code = [self.__compile_statement(statement) for statement in statements]
+        trace = statements if self.trace_output else None
+        num_slots = self.resolver.block_size(statements)
+        env = self.env
+
+        def run_statements():
+            env.push_block(num_slots)
+            try:
+                for i, run_statement in enumerate(code):
+                    if trace is not None:
+                        print(f"line {trace[i].line_num}: {trace[i]}")
+                    return_val = run_statement()
+                    if return_val is not None:
+                        return return_val
+            finally:
+                env.pop_block()
+            return None
+
+        return run_statements
+
+    def __compile_statement(self, statement):
+        compiler = self.stmt_compilers.get(statement.elem_type)
+        if compiler is None:
+            return lambda: None
+        if self.profiler is None:
+            return compiler(statement)
+        kind = Interpreter.STATEMENT_NAMES.get(statement.elem_type, statement.elem_type)
+        label = self.__node_label(kind, statement)  # label before compiling, so nested statements come after
+        return self.__profiled(compiler(statement), kind, label)
+
+    def __compile_call_stmt(self, call_node):
+        call = self.__compile_call(call_node)
+
+        def run_call():
+            call()
+
+        return run_call
+
+    def __compile_call(self, call_node):
+        func_name = call_node.name
+        actual_args = call_node.args
+        if func_name == "print":
+            return self.__compile_print(actual_args)
+        if func_name == "inputi" or func_name == "inputs":
+            return self.__compile_input(func_name, actual_args, call_node.line_num)
+        return self.__compile_user_call(func_name, actual_args, call_node.line_num)
+
+    def __compile_user_call(self, func_name, actual_args, line_num=None):
+        arg_code = [self.__compile_lazy_expr(actual_ast) for actual_ast in actual_args]
+        num_args = len(actual_args)
+        env = self.env
+
+        def call_func():
+            num_slots, arg_slots, body = self.__get_func_code(func_name, num_args, line_num)
+            # first evaluate all of the actual parameters and store them in the formal parameters' slots
+            args = [None] * num_slots
+            for slot, eval_arg in zip(arg_slots, arg_code):
+                args[slot] = eval_arg()
+
+            # then create the new activation record, whose first block holds the arguments
+            env.push_func(args)
+            try:
+                return_val = body()
+            finally:
+                env.pop_func()
+            if return_val is None:
+                return Interpreter.NIL_VALUE
+            return return_val
+
+        return call_func
 
     # document that print is all or nothing. if an exception occurs, then the output is not printed
-    def __call_print(self, args):
-        output = ""
-        for arg in args:
-            status, result = self.__eval_expr(arg, True)  # result is a Value object   # document forced evaluation
-            if status == ExecStatus.EXCEPTION:
-                return (status, result) # result is the exception type
-            output = output + get_printable(result)
-        super().output(output)
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
-
-    def __call_input(self, name, args):
-        if args is not None and len(args) == 1:
-            status, result = self.__eval_expr(args[0], True) # document forced evaluation
-            if status == ExecStatus.EXCEPTION:
-                return (status, result)
-            super().output(get_printable(result))
-        elif args is not None and len(args) > 1:
-            super().error(
-                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
-            )
-        inp = super().get_input()
-        if name == "inputi":
-            return (ExecStatus.CONTINUE, Value(Type.INT, int(inp)))
-        if name == "inputs":
-            return (ExecStatus.CONTINUE, Value(Type.STRING, inp))
-
-    def __assign(self, assign_ast):
-        var_name = assign_ast.get("name")
-        status, value_obj = self.__eval_expr(assign_ast.get("expression"))
-        if status == ExecStatus.EXCEPTION:
-            return (status, value_obj)
-
-        if not self.env.set(var_name, value_obj):
-            super().error(
-                ErrorType.NAME_ERROR, f"Undefined variable {var_name} in assignment"
+    def __compile_print(self, args):
+        arg_code = [self.__compile_expr(arg) for arg in args]  # document forced evaluation
+
+        def call_print():
+            output = ""
+            for eval_arg in arg_code:
+                output = output + get_printable(eval_arg())
+            self.output(output)
+            return Interpreter.NIL_VALUE
+
+        return call_print
+
+    def __compile_input(self, name, args, line_num=None):
+        if args is not None and len(args) > 1:
+            return lambda: self.error(
+                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter", line_num
             )
-        return (status, value_obj)
+        prompt = None
+        if args is not None and len(args) == 1:
+            prompt = self.__compile_expr(args[0]) # document forced evaluation
+        convert = (lambda inp: int_value(int(inp))) if name == "inputi" else (lambda inp: Value(Type.STRING, inp))
+
+        def call_input():
+            if prompt is not None:
+                self.output(get_printable(prompt()))
+            inp = self.get_input()
+            return convert(inp)
+
+        return call_input
+
+    def __compile_assign(self, assign_ast):
+        expr_type = assign_ast.expression.elem_type
+        if id(assign_ast) in self.strict and expr_type not in Interpreter.LITERAL_NODES and expr_type != InterpreterBase.VAR_NODE:
+            return self.__compile_strict_assign(assign_ast)
+        var_name = assign_ast.name
+        eval_expr = self.__compile_lazy_expr(assign_ast.expression)
+        address = self.resolver.address(assign_ast)
+        line_num = assign_ast.line_num
+        env = self.env
+
+        def assign():
+            value_obj = eval_expr()
+            if address is None:
+                self.error(
+                    ErrorType.NAME_ERROR, f"Undefined variable {var_name} in assignment", line_num
+                )
+            env.set(address[0], address[1], value_obj)
+
+        return assign
+
+    # an assignment whose value the next statement forces first (see strictness_v4.py) is
+    # evaluated right away instead of becoming a thunk. If that raises, it leaves the state
+    # lazy evaluation would have: the next statement would have forced the thunk and raised
+    # the same exception, in the same try, leaving the variable bound to the unevaluated
+    # thunk. So the variable gets that thunk before the exception propagates. Evaluating
+    # the expression can't rebind this function's variables (forcing a thunk only caches its
+    # value in place), so the thunk captures the same bindings it would have captured here
+    def __compile_strict_assign(self, assign_ast):
+        eval_now = self.__compile_expr(assign_ast.expression)
+        delay = self.__compile_lazy_expr(assign_ast.expression)
+        depth, slot = self.resolver.address(assign_ast)
+        env = self.env
+
+        def assign_strict():
+            try:
+                value_obj = eval_now()
+            except BrewinException:
+                env.set(depth, slot, delay())
+                raise
+            env.set(depth, slot, value_obj)
+
+        return assign_strict
+
+    def __compile_var_def(self, var_ast):
+        var_name = var_ast.name
+        address = self.resolver.address(var_ast)
+        line_num = var_ast.line_num
+        env = self.env
+
+        def var_def():
+            if address is None:
+                self.error(
+                    ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}", line_num
+                )
+            env.set(address[0], address[1], Interpreter.NIL_VALUE)
 
-    def __var_def(self, var_ast):
-        var_name = var_ast.get("name")
-        if not self.env.create(var_name, Interpreter.NIL_VALUE):
-            super().error(
-                ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}"
-            )
+        return var_def
 
     # document that all type checking of lazy expressions is done only at the time of evaluation
     # document that all binary expressions are evaluated from left to right and so an exception on the first one will prevent the second one from being evaluated
 
-    def __eval_expr(self, expr_ast, eager = False):
-        if expr_ast.elem_type == InterpreterBase.NIL_NODE:
-            return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
-        if expr_ast.elem_type == InterpreterBase.INT_NODE:
-            return (ExecStatus.CONTINUE, Value(Type.INT, expr_ast.get("val")))
-        if expr_ast.elem_type == InterpreterBase.STRING_NODE:
-            return (ExecStatus.CONTINUE, Value(Type.STRING, expr_ast.get("val")))
-        if expr_ast.elem_type == InterpreterBase.BOOL_NODE:
-            return (ExecStatus.CONTINUE, Value(Type.BOOL, expr_ast.get("val")))
-
-        if eager is False:
-            #print(f"delaying evaluation: {expr_ast.elem_type}")
-            #if (expr_ast.elem_type == "fcall"):
-            #    print("funcname: ", expr_ast.get("name"))
-            return (ExecStatus.CONTINUE, LazyValue(expr_ast, self.env.get_top_env()))
-
-        #print(f"forcing evaluation: {expr_ast.elem_type}")
-        #if (expr_ast.elem_type == "fcall"):
-        #    print("funcname: ", expr_ast.get("name"))
-
-        if expr_ast.elem_type == InterpreterBase.VAR_NODE:
-            var_name = expr_ast.get("name")
-            val = self.env.get(var_name)
-            if val is None:
-                super().error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
-            return self.__evaluate_if_necessary(val, eager)
+    # returns the (depth, slot) of a variable node in the environment the code being compiled
+    # will run in: the function's own environment, or the captured bindings of a thunk
+    def __address(self, node):
+        if self.thunk_addresses is not None:
+            return self.thunk_addresses.get(id(node))
+        return self.resolver.address(node)
+
+    # compiles an expression whose evaluation is deferred: literals are produced directly,
+    # a variable's value is passed along as is, evaluated or not (a LazyValue is its own memo
+    # cell, so every alias of it sees a single evaluation), and anything else becomes a
+    # LazyValue that captures only the variables the expression reads
+    def __compile_lazy_expr(self, expr_ast):
+        if expr_ast.elem_type in Interpreter.LITERAL_NODES:
+            return self.__compile_literal(expr_ast)
+        env = self.env
+        if expr_ast.elem_type == InterpreterBase.VAR_NODE and self.__address(expr_ast) is not None:
+            depth, slot = self.__address(expr_ast)
+            return lambda: env.get(depth, slot)
+
+        # give each distinct variable read by the expression an index in the thunk's bindings,
+        # then compile the expression to read from those bindings
+        captured = []
+        thunk_addresses = {}
+        for var_ast in self.resolver.free_vars(expr_ast):
+            address = self.__address(var_ast)
+            if address not in captured:
+                captured.append(address)
+            thunk_addresses[id(var_ast)] = (0, captured.index(address))
+        outer_addresses = self.thunk_addresses
+        self.thunk_addresses = thunk_addresses
         if expr_ast.elem_type == InterpreterBase.FCALL_NODE:
-            status, result = self.__call_func(expr_ast)
-            #print(f"FCALL: status: {status}, result: {result}")
-            if status == ExecStatus.EXCEPTION:
-                return (status, result) # result is the exception type
-            return self.__evaluate_if_necessary(result, True)
-        # document that all binary operations must be evaluated from left to right when they are evaluated
-        if expr_ast.elem_type in Interpreter.BIN_OPS:
-            return self.__eval_op(expr_ast)
-        if expr_ast.elem_type == Interpreter.NEG_NODE:
-            return self.__eval_unary(expr_ast, Type.INT, lambda x: -1 * x)
-        if expr_ast.elem_type == Interpreter.NOT_NODE:
-            return self.__eval_unary(expr_ast, Type.BOOL, lambda x: not x)
-
-    def __evaluate_if_necessary(self, val, eager):
-        if val.evaluated() or not eager:
-            #if val.evaluated() and type(val.value()) == LazyValue:
-            #   print("Reusing cached value: ", val.value())
-            return (ExecStatus.CONTINUE, val)
-
-        #print("eval if necessary")
-        env_to_eval = val.env()
-        self.env.push_func(env_to_eval)
-        status, evaluated_val = self.__eval_expr(val.ast(), True)
-
-        # cache result
-        #print("Caching result: ", evaluated_val.value())
-        if status != ExecStatus.EXCEPTION:
-            val.set_type_value(evaluated_val.type(), evaluated_val.value())
-            status = ExecStatus.CONTINUE
-
-        self.env.pop_func()
-        return (status, evaluated_val)
-
-    def __eval_op(self, arith_ast):
-        if arith_ast.elem_type in ["||", "&&"]:
-            return self.__eval_logical(arith_ast)
-
-        left_status, left_value_obj = self.__eval_expr(arith_ast.get("op1"), True)
-        if left_status == ExecStatus.EXCEPTION:
-            return (ExecStatus.EXCEPTION, left_value_obj) # document: evaluate left side first so if both would throw execptions, only left gets thrown
-
-        right_status, right_value_obj = self.__eval_expr(arith_ast.get("op2"), True)
-        if right_status == ExecStatus.EXCEPTION:
-            return (ExecStatus.EXCEPTION, right_value_obj)
-
-        if not self.__compatible_types(
-            arith_ast.elem_type, left_value_obj, right_value_obj
-        ):
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Incompatible types for {arith_ast.elem_type} operation",
-            )
-        if arith_ast.elem_type not in self.op_to_lambda[left_value_obj.type()]:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Incompatible operator {arith_ast.elem_type} for type {left_value_obj.type()}",
-            )
-        f = self.op_to_lambda[left_value_obj.type()][arith_ast.elem_type]
-
-        #print(f"evaluating binary: {left_value_obj.value()} {arith_ast.elem_type} {right_value_obj.value()}")
-        if arith_ast.elem_type == "/" and right_value_obj.value() == 0:  # document div0 exception
-            return (ExecStatus.EXCEPTION, Interpreter.DIV_ZERO)
-
-        return (ExecStatus.CONTINUE, f(left_value_obj, right_value_obj))
-
-    def __eval_logical(self, arith_ast):
-        left_status, left_value_obj = self.__eval_expr(arith_ast.get("op1"), True)
-        if left_status == ExecStatus.EXCEPTION:
-            return (ExecStatus.EXCEPTION, left_value_obj)
-        if left_value_obj.type() != Type.BOOL:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
-            )
-        if (arith_ast.elem_type == "||" and left_value_obj.value()):
-            return (ExecStatus.CONTINUE, Value(Type.BOOL, True))
-        elif (arith_ast.elem_type == "&&" and not left_value_obj.value()):
-            return (ExecStatus.CONTINUE, Value(Type.BOOL, False))
+            # the thunk only makes the call; what the call returns may itself be unevaluated,
+            # and is forced by __evaluate_if_necessary (see there)
+            eval_expr = self.__compile_call(expr_ast)
+        else:
+            eval_expr = self.__compile_expr(expr_ast)
+        self.thunk_addresses = outer_addresses
+        if self.profiler is not None:
+            label = self.__node_label("lazy", expr_ast)
+            eval_expr = self.__profiled(eval_expr, "thunk", label, f"{label} ({self.compiling_func})")
+
+        leading_var_asts = []
+        leading_vars(expr_ast, leading_var_asts)
+        leading = []
+        for var_ast in leading_var_asts:
+            if id(var_ast) not in thunk_addresses:
+                break  # an undefined variable, which is an error once it's read
+            if thunk_addresses[id(var_ast)][1] not in leading:
+                leading.append(thunk_addresses[id(var_ast)][1])
+        leading = tuple(leading)
+
+        def delay():
+            bindings = [env.get(depth, slot) for depth, slot in captured]
+            return LazyValue(expr_ast, bindings, eval_expr, leading)
+
+        return delay
+
+    # compiles an expression that is evaluated eagerly
+    def __compile_expr(self, expr_ast):
+        compiler = self.expr_compilers.get(expr_ast.elem_type)
+        if compiler is None:
+            return lambda: None
+        return compiler(expr_ast)
+
+    # a literal's Value is made once, when it's compiled, and shared by every evaluation
+    def __compile_literal(self, expr_ast):
+        if expr_ast.elem_type == InterpreterBase.NIL_NODE:
+            result = Interpreter.NIL_VALUE
+        elif expr_ast.elem_type == InterpreterBase.INT_NODE:
+            result = int_value(expr_ast.val)
+        elif expr_ast.elem_type == InterpreterBase.STRING_NODE:
+            result = Value(Type.STRING, expr_ast.val)
         else:
-            right_status, right_value_obj = self.__eval_expr(arith_ast.get("op2"), True)
-            if right_status == ExecStatus.EXCEPTION:
-                return (ExecStatus.EXCEPTION, right_value_obj)
+            result = bool_value(expr_ast.val)
+        return lambda: result
+
+    def __compile_var(self, expr_ast):
+        var_name = expr_ast.name
+        address = self.__address(expr_ast)
+        if address is None:
+            return lambda: self.error(ErrorType.NAME_ERROR, f"Variable {var_name} not found", expr_ast.line_num)
+        depth, slot = address
+        env = self.env
+
+        def eval_var():
+            return self.__evaluate_if_necessary(env.get(depth, slot))
+
+        return eval_var
+
+    def __compile_call_expr(self, expr_ast):
+        call = self.__compile_call(expr_ast)
+
+        def eval_call():
+            return self.__evaluate_if_necessary(call())
+
+        return eval_call
+
+    # Forces a value without recursing through chains of thunks, using an explicit work stack
+    # of thunks still to be evaluated:
+    #  - a thunk's leading bindings (see strictness_v4.leading_vars) are forced before it runs, so a
+    #    chain like the one x = x + 1 builds in a loop is forced innermost first and each
+    #    thunk's code finds its bindings already evaluated
+    #  - a thunk of a function call evaluates to whatever the call returns, which is often
+    #    another unevaluated call (return f(x) is lazy). The thunk only runs its own call, and
+    #    takes the value of the thunk it returned once that's forced, so tail calls run in
+    #    constant Python stack depth
+    # Every thunk caches its value; if one raises, it and the thunks waiting on it stay unevaluated
+    def __evaluate_if_necessary(self, val):
+        if val.evaluated():
+            return val
+
+        env = self.env
+        work = [[val, []]]  # [thunk, thunks that take its value]
+        while True:
+            entry = work[-1]
+            val = entry[0]
+            if val.evaluated():
+                evaluated_val = val
+            else:
+                bindings = val.env()
+                dependency = None
+                for index in val.leading:
+                    if not bindings[index].evaluated():
+                        dependency = bindings[index]
+                        break
+                if dependency is not None:
+                    work.append([dependency, []])
+                    continue
+
+                env.push_func(bindings)
+                try:
+                    evaluated_val = val.code()()
+                finally:
+                    env.pop_func()
+                if not evaluated_val.evaluated():
+                    entry[0] = evaluated_val
+                    entry[1].append(val)
+                    continue
+                # cache result
+                val.set_type_value(evaluated_val.type(), evaluated_val.value())
+
+            for forwarded in entry[1]:
+                forwarded.set_type_value(evaluated_val.type(), evaluated_val.value())
+            work.pop()
+            if not work:
+                return evaluated_val
+
+    # document that all binary operations must be evaluated from left to right when they are evaluated
+    #
+    # Each operator keeps an inline cache of the operand types it last saw and the binary_ops
+    # function for them, so an operator that always sees the same types (the common case)
+    # skips the table lookup
+    def __compile_op(self, arith_ast):
+        oper = arith_ast.elem_type
+        eval_left = self.__compile_expr(arith_ast.op1)
+        eval_right = self.__compile_expr(arith_ast.op2)
+        binary_ops = self.binary_ops
+        is_div = oper == "/"
+        line_num = arith_ast.line_num
+        cached_left_type = cached_right_type = cached_op = None
+
+        def eval_op():
+            nonlocal cached_left_type, cached_right_type, cached_op
+            left_value_obj = eval_left() # document: evaluate left side first so if both would throw execptions, only left gets thrown
+            right_value_obj = eval_right()
+
+            # evaluated values (including forced LazyValues) keep their type and value in t and v
+            left_type = left_value_obj.t
+            right_type = right_value_obj.t
+            if left_type != cached_left_type or right_type != cached_right_type:
+                f = binary_ops.get((oper, left_type, right_type))
+                if f is None:
+                    self.report_op_error(oper, left_type, right_type, line_num)
+                cached_left_type, cached_right_type, cached_op = left_type, right_type, f
+
+            if is_div and right_value_obj.v == 0:  # document div0 exception
+                raise BrewinException(Interpreter.DIV_ZERO)
+
+            return cached_op(left_value_obj.v, right_value_obj.v)
+
+        return eval_op
+
+    def __compile_logical(self, arith_ast):
+        oper = arith_ast.elem_type
+        eval_left = self.__compile_expr(arith_ast.op1)
+        eval_right = self.__compile_expr(arith_ast.op2)
+        short_circuit_on = oper == "||"
+        line_num = arith_ast.line_num
+
+        def eval_logical():
+            left_value_obj = eval_left()
+            if left_value_obj.type() != Type.BOOL:
+                self.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible type for {oper} operation",
+                    line_num,
+                )
+            if left_value_obj.value() == short_circuit_on:
+                return bool_value(short_circuit_on)
+            right_value_obj = eval_right()
             if right_value_obj.type() != Type.BOOL:
-                super().error(
+                self.error(
                     ErrorType.TYPE_ERROR,
-                    f"Incompatible type for {arith_ast.elem_type} operation",
+                    f"Incompatible type for {oper} operation",
+                    line_num,
                 )
             # the right side was guaranteed to be false for || and true for &&, so all we need to do is return the right_value_obj now
             # for ||, if the right side is true, then the whole expression is true
             # for &&, if the right side is false, then the whole expression is false
-            return (ExecStatus.CONTINUE, right_value_obj)
+            return right_value_obj
 
-    def __compatible_types(self, oper, obj1, obj2):
-        # DOCUMENT: allow comparisons ==/!= of anything against anything
-        if oper in ["==", "!="]:
-            return True
-        return obj1.type() == obj2.type()
+        return eval_logical
 
-    def __eval_unary(self, arith_ast, t, f):
-        status, value_obj = self.__eval_expr(arith_ast.get("op1"), True)
-        #print(f"evaluating unary: {status} {value_obj.value()} {value_obj.type()}")
-        if status == ExecStatus.EXCEPTION:
-            return (ExecStatus.EXCEPTION, value_obj)
+    def __compile_unary(self, arith_ast, t, f):
+        oper = arith_ast.elem_type
+        eval_operand = self.__compile_expr(arith_ast.op1)
+        line_num = arith_ast.line_num
 
-        if value_obj.type() != t:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
-            )
-        return (ExecStatus.CONTINUE, Value(t, f(value_obj.value())))
+        def eval_unary():
+            value_obj = eval_operand()
+            if value_obj.type() != t:
+                self.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible type for {oper} operation",
+                    line_num,
+                )
+            return f(value_obj.value())
+
+        return eval_unary
 
+    # binary_ops maps (operator, left type, right type) to a function that takes the operands'
+    # raw Python values and returns the result Value. A combination that isn't in the table
+    # is a type error (see report_op_error)
     def __setup_ops(self):
-        self.op_to_lambda = {}
+        self.binary_ops = {}
         # set up operations on integers
-        self.op_to_lambda[Type.INT] = {}
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
-        )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), x.value() - y.value()
-        )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), x.value() * y.value()
-        )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), x.value() // y.value()
-        )
-        self.op_to_lambda[Type.INT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
-        )
-        self.op_to_lambda[Type.INT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
-        )
-        self.op_to_lambda[Type.INT]["<"] = lambda x, y: Value(
-            Type.BOOL, x.value() < y.value()
-        )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, x.value() <= y.value()
-        )
-        self.op_to_lambda[Type.INT][">"] = lambda x, y: Value(
-            Type.BOOL, x.value() > y.value()
-        )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, x.value() >= y.value()
-        )
+        int_ops = {
+            "+": lambda x, y: int_value(x + y),
+            "-": lambda x, y: int_value(x - y),
+            "*": lambda x, y: int_value(x * y),
+            "/": lambda x, y: int_value(x // y),  # callers raise div0 before dividing by 0
+            "==": lambda x, y: bool_value(x == y),
+            "!=": lambda x, y: bool_value(x != y),
+            "<": lambda x, y: bool_value(x < y),
+            "<=": lambda x, y: bool_value(x <= y),
+            ">": lambda x, y: bool_value(x > y),
+            ">=": lambda x, y: bool_value(x >= y),
+        }
         #  set up operations on strings
-        self.op_to_lambda[Type.STRING] = {}
-        self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
-        )
-        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
-        )
-        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
-        )
-        #  set up operations on bools
-        self.op_to_lambda[Type.BOOL] = {}
-
-        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
-        )
-        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
-        )
-
-        #  set up operations on nil
-        self.op_to_lambda[Type.NIL] = {}
-        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
-        )
-        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
-        )
-
-    def __do_if(self, if_ast):
-        cond_ast = if_ast.get("condition")
-        status, result = self.__eval_expr(cond_ast, True) # document forced evaluation
-        if status == ExecStatus.EXCEPTION:
-            return (status, result)
-
-        if result.type() != Type.BOOL:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                "Incompatible type for if condition",
-            )
-        if result.value():
-            statements = if_ast.get("statements")
-            status, return_val = self.__run_statements(statements)
-            return (status, return_val)
-        else:
-            else_statements = if_ast.get("else_statements")
-            if else_statements is not None:
-                status, return_val = self.__run_statements(else_statements)
-                return (status, return_val)
-
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
-
-    def __do_for(self, for_ast):
-        init_ast = for_ast.get("init")
-        cond_ast = for_ast.get("condition")
-        update_ast = for_ast.get("update")
-
-        self.__run_statement(init_ast)  # initialize counter variable
-        run_for = Interpreter.TRUE_VALUE
-        while run_for.value():
-            status, run_for = self.__eval_expr(cond_ast, True)  # check for-loop condition # document forced evaluation
-            if status == ExecStatus.EXCEPTION:
-                return (status, run_for)
-
-            if run_for.type() != Type.BOOL:
-                super().error(
+        string_ops = {
+            "+": lambda x, y: Value(Type.STRING, x + y),
+            "==": lambda x, y: bool_value(x == y),
+            "!=": lambda x, y: bool_value(x != y),
+        }
+        #  set up operations on bools and nil
+        equality_ops = {
+            "==": lambda x, y: bool_value(x == y),
+            "!=": lambda x, y: bool_value(x != y),
+        }
+        for t, ops in ((Type.INT, int_ops), (Type.STRING, string_ops), (Type.BOOL, equality_ops), (Type.NIL, equality_ops)):
+            for oper, f in ops.items():
+                self.binary_ops[(oper, t, t)] = f
+
+        # DOCUMENT: allow comparisons ==/!= of anything against anything
+        all_types = (Type.INT, Type.STRING, Type.BOOL, Type.NIL)
+        for left_type in all_types:
+            for right_type in all_types:
+                if left_type != right_type:
+                    self.binary_ops[("==", left_type, right_type)] = lambda x, y: Interpreter.FALSE_VALUE
+                    self.binary_ops[("!=", left_type, right_type)] = lambda x, y: Interpreter.TRUE_VALUE
+
+    # reports the type error for an operator applied to operands it has no entry for in binary_ops
+    def report_op_error(self, oper, left_type, right_type, line_num=None):
+        if left_type != right_type:
+            self.error(ErrorType.TYPE_ERROR, f"Incompatible types for {oper} operation", line_num)
+        self.error(ErrorType.TYPE_ERROR, f"Incompatible operator {oper} for type {left_type}", line_num)
+
+    def __compile_if(self, if_ast):
+        eval_cond = self.__compile_expr(if_ast.condition) # document forced evaluation
+        run_then = self.__compile_statements(if_ast.statements)
+        else_statements = if_ast.else_statements
+        run_else = None
+        line_num = if_ast.line_num
+        if else_statements is not None:
+            run_else = self.__compile_statements(else_statements)
+
+        def do_if():
+            result = eval_cond()
+            if result.type() != Type.BOOL:
+                self.error(
                     ErrorType.TYPE_ERROR,
-                    "Incompatible type for for condition",
+                    "Incompatible type for if condition",
+                    line_num,
                 )
-            if run_for.value():
-                statements = for_ast.get("statements")
-                status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.RETURN or status == ExecStatus.EXCEPTION:
-                    return status, return_val
-                self.__run_statement(update_ast)  # update counter variable
-
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+            if result.value():
+                return run_then()
+            if run_else is not None:
+                return run_else()
+            return None
+
+        return do_if
+
+    def __compile_for(self, for_ast):
+        run_init = self.__compile_statement(for_ast.init)
+        eval_cond = self.__compile_expr(for_ast.condition)  # document forced evaluation
+        run_update = self.__compile_statement(for_ast.update)
+        run_body = self.__compile_statements(for_ast.statements)
+        line_num = for_ast.line_num
+
+        def do_for():
+            run_init()  # initialize counter variable
+            while True:
+                run_for = eval_cond()  # check for-loop condition
+                if run_for.type() != Type.BOOL:
+                    self.error(
+                        ErrorType.TYPE_ERROR,
+                        "Incompatible type for for condition",
+                        line_num,
+                    )
+                if not run_for.value():
+                    return None
+                return_val = run_body()
+                if return_val is not None:
+                    return return_val
+                run_update()  # update counter variable
+
+        return do_for
 
     # document return expression is lazy
-    def __do_return(self, return_ast):
-        expr_ast = return_ast.get("expression")
+    def __compile_return(self, return_ast):
+        expr_ast = return_ast.expression
         if expr_ast is None:
-            return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
-        status, ret_val = self.__eval_expr(expr_ast)
-        if status == ExecStatus.EXCEPTION:
-            return (status, ret_val)
-        return (ExecStatus.RETURN, copy.copy(ret_val))
+            return lambda: Interpreter.NIL_VALUE
+        return self.__compile_lazy_expr(expr_ast)
 
     # document we will never raise in an expression used by a raise (e.g. raise foo(), foo() will never raise itself)
     # document that raise argument evaluation is eager
-    def __do_raise(self, return_ast):
-        expr_ast = return_ast.get("exception_type")
-        #print("RAISE: ", expr_ast)
-        _, exception_type = self.__eval_expr(expr_ast, True)
-        value_obj = copy.copy(exception_type)
-        if exception_type.type() != Type.STRING:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Invalid type for raise argument: {value_obj.type()}",
-            )
-        return (ExecStatus.EXCEPTION, value_obj)
-
-    def __do_try(self, try_ast):
-        statements = try_ast.get("statements")
-        status, return_val = self.__run_statements(statements)
-        if status != ExecStatus.EXCEPTION:
-            return (status, return_val)
-        catchers = try_ast.get("catchers")
-        for catcher_ast in catchers:
-            exception_type = catcher_ast.get("exception_type")
-            if return_val.value() == exception_type:
-                return self.__run_statements(catcher_ast.get("statements"))
-
-        # propagate error
-        return (status, return_val)
+    def __compile_raise(self, raise_ast):
+        eval_expr = self.__compile_expr(raise_ast.exception_type)
+        line_num = raise_ast.line_num
+
+        def do_raise():
+            value_obj = eval_expr()
+            if value_obj.type() != Type.STRING:
+                self.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Invalid type for raise argument: {value_obj.type()}",
+                    line_num,
+                )
+            raise BrewinException(value_obj)
+
+        return do_raise
+
+    def __compile_try(self, try_ast):
+        run_try = self.__compile_statements(try_ast.statements)
+        catchers = {}  # exception string -> compiled catch block; the first catcher for a string wins
+        for catcher_ast in try_ast.catchers:
+            if catcher_ast.exception_type not in catchers:
+                catchers[catcher_ast.exception_type] = self.__compile_statements(catcher_ast.statements)
+
+        def do_try():
+            try:
+                return run_try()
+            except BrewinException as exception:
+                run_catcher = catchers.get(exception.value_obj.value())
+                if run_catcher is None:
+                    raise  # propagate error
+            # the catcher runs outside the except clause, so an exception it raises doesn't chain onto this one
+            return run_catcher()
+
+        return do_try
@@ -171,16 +171,19 @@ class Interpreter(InterpreterBase):
 
     # Initialization Routines
     def run(self, program):
-        self.prog = BrewinProgram(program, self)
+        try:
+            self.prog = BrewinProgram(program, self)
 
-        self.env.reset()
+            self.env.reset()
 
-        # Result is discarded for main function
-        ret_val = self.__exec_func('main', [])
-        if isinstance(ret_val, BrewinException):
-            self.error(ErrorType.FAULT_ERROR, f"Unhandled exception {ret_val.msg}")
+            # Result is discarded for main function
+            ret_val = self.__exec_func('main', [])
+            if isinstance(ret_val, BrewinException):
+                self.error(ErrorType.FAULT_ERROR, f"Unhandled exception {ret_val.msg}")
 
-    # Execute a function, returns need for result without eager eval, or an exception
+        # Execute a function, returns need for result without eager eval, or an exception
+        finally:
+            self.finish()
     def __exec_func(self, func_name, args):
         if func_name == 'inputi':
             return self.__lib_inputi(args)
@@ -0,0 +1,186 @@
+from intbase import InterpreterBase
+
+# Compact, typed alternatives to brewparse's Element nodes. Each node kind is its own class
+# with __slots__, so a node carries no per-instance dict and its fields are read as plain
+# attributes (node.name, node.op1, ...). get() is kept so code written against Element keeps
+# working on these nodes too. Like Elements, every node has the line_num and col_num of its
+# source position (None for nodes that don't come from the source).
+#
+# brewparse builds these nodes directly when make_node is its node factory:
+#     parse_program(program, make_node)
+class Node:
+    __slots__ = ("line_num", "col_num")
+    elem_type = None
+    field_names = ()
+
+    def __init__(self, *values, line_num=None, col_num=None):
+        for field, value in zip(self.field_names, values):
+            setattr(self, field, value)
+        self.line_num = line_num
+        self.col_num = col_num
+
+    def get(self, key):
+        return getattr(self, key, None)
+
+    def __str__(self):
+        s = f"{self.elem_type}: "
+        for key in self.field_names:
+            if key != "elem_type":
+                s += key + ": " + self.__val(getattr(self, key)) + ", "
+        return s[0:-2]
+
+    def __val(self, v):
+        if isinstance(v, Node):
+            return "[" + str(v) + "]"
+        if isinstance(v, list):
+            return "[" + ", ".join(str(i) for i in v) + "]"
+        return str(v)
+
+    # nodes have no __dict__, so pickling (e.g. by the AST cache) needs these
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.field_names) + (self.line_num, self.col_num)
+
+    def __setstate__(self, state):
+        Node.__init__(self, *state[:-2], line_num=state[-2], col_num=state[-1])
+
+
+class ProgramNode(Node):
+    __slots__ = ("structs", "functions")
+    elem_type = InterpreterBase.PROGRAM_NODE
+    field_names = ("structs", "functions")
+
+
+class StructNode(Node):
+    __slots__ = ("name", "fields")
+    elem_type = InterpreterBase.STRUCT_NODE
+    field_names = __slots__
+
+
+class FieldDefNode(Node):
+    __slots__ = ("name", "var_type")
+    elem_type = InterpreterBase.FIELD_DEF_NODE
+    field_names = __slots__
+
+
+class FuncNode(Node):
+    __slots__ = ("name", "args", "return_type", "statements")
+    elem_type = InterpreterBase.FUNC_NODE
+    field_names = __slots__
+
+
+class ArgNode(Node):
+    __slots__ = ("name", "var_type")
+    elem_type = InterpreterBase.ARG_NODE
+    field_names = __slots__
+
+
+class AssignNode(Node):
+    __slots__ = ("name", "expression")
+    elem_type = "="
+    field_names = __slots__
+
+
+class VarDefNode(Node):
+    __slots__ = ("name", "var_type")
+    elem_type = InterpreterBase.VAR_DEF_NODE
+    field_names = __slots__
+
+
+class IfNode(Node):
+    __slots__ = ("condition", "statements", "else_statements")
+    elem_type = InterpreterBase.IF_NODE
+    field_names = __slots__
+
+
+class ForNode(Node):
+    __slots__ = ("init", "condition", "update", "statements")
+    elem_type = InterpreterBase.FOR_NODE
+    field_names = __slots__
+
+
+class TryNode(Node):
+    __slots__ = ("statements", "catchers")
+    elem_type = InterpreterBase.TRY_NODE
+    field_names = __slots__
+
+
+class CatchNode(Node):
+    __slots__ = ("exception_type", "statements")
+    elem_type = InterpreterBase.CATCH_NODE
+    field_names = __slots__
+
+
+class RaiseNode(Node):
+    __slots__ = ("exception_type",)
+    elem_type = InterpreterBase.RAISE_NODE
+    field_names = __slots__
+
+
+class ReturnNode(Node):
+    __slots__ = ("expression",)
+    elem_type = InterpreterBase.RETURN_NODE
+    field_names = __slots__
+
+
+class FCallNode(Node):
+    __slots__ = ("name", "args")
+    elem_type = InterpreterBase.FCALL_NODE
+    field_names = __slots__
+
+
+class VarNode(Node):
+    __slots__ = ("name",)
+    elem_type = InterpreterBase.VAR_NODE
+    field_names = __slots__
+
+
+class NewNode(Node):
+    __slots__ = ("var_type",)
+    elem_type = InterpreterBase.NEW_NODE
+    field_names = __slots__
+
+
+class NilNode(Node):
+    __slots__ = ()
+    elem_type = InterpreterBase.NIL_NODE
+
+
+# int, string and bool literals; elem_type says which
+class LiteralNode(Node):
+    __slots__ = ("elem_type", "val")
+    field_names = __slots__
+
+
+# neg and !
+class UnaryOpNode(Node):
+    __slots__ = ("elem_type", "op1")
+    field_names = __slots__
+
+
+# arithmetic, comparison and logical operators; elem_type is the operator
+class BinaryOpNode(Node):
+    __slots__ = ("elem_type", "op1", "op2")
+    field_names = __slots__
+
+
+NODE_CLASSES = {
+    cls.elem_type: cls
+    for cls in (
+        ProgramNode, StructNode, FieldDefNode, FuncNode, ArgNode, AssignNode, VarDefNode,
+        IfNode, ForNode, TryNode, CatchNode, RaiseNode, ReturnNode, FCallNode, VarNode,
+        NewNode, NilNode,
+    )
+}
+LITERAL_TYPES = {InterpreterBase.INT_NODE, InterpreterBase.STRING_NODE, InterpreterBase.BOOL_NODE}
+UNARY_OPS = {InterpreterBase.NEG_NODE, InterpreterBase.NOT_NODE}
+
+
+# builds the node for elem_type with the given fields; called by the parser like Element
+def make_node(elem_type, **fields):
+    if elem_type in LITERAL_TYPES:
+        cls = LiteralNode
+    elif elem_type in UNARY_OPS:
+        cls = UnaryOpNode
+    else:
+        cls = NODE_CLASSES.get(elem_type, BinaryOpNode)
+    return cls(*[elem_type if field == "elem_type" else fields.get(field) for field in cls.field_names])
@@ -0,0 +1,166 @@
+from intbase import InterpreterBase
+from nodes import (
+    ForNode, FuncNode, IfNode, LiteralNode, ProgramNode, TryNode, CatchNode,
+    AssignNode, FCallNode, ReturnNode, RaiseNode, BinaryOpNode, UnaryOpNode,
+)
+
+# The optimizer rewrites a program's compact AST (see nodes.py) before it runs:
+#  - operators whose operands are all literals are folded into a single literal
+#  - if statements and for loops whose condition is a literal true/false lose the branch
+#    that can never run, and statements after a return or raise in the same block are dropped
+# Anything that would fail at runtime is left alone, so div0 is still raised and type errors
+# are still reported when (and only when) the offending code is reached. The input tree is
+# never modified; unchanged subtrees are shared with the result.
+
+ARITH_OPS = {
+    InterpreterBase.INT_NODE: {
+        "+": lambda x, y: x + y,
+        "-": lambda x, y: x - y,
+        "*": lambda x, y: x * y,
+        "/": lambda x, y: x // y,
+        "<": lambda x, y: x < y,
+        "<=": lambda x, y: x <= y,
+        ">": lambda x, y: x > y,
+        ">=": lambda x, y: x >= y,
+    },
+    InterpreterBase.STRING_NODE: {
+        "+": lambda x, y: x + y,
+    },
+}
+RESULT_TYPES = {"<": InterpreterBase.BOOL_NODE, "<=": InterpreterBase.BOOL_NODE,
+                ">": InterpreterBase.BOOL_NODE, ">=": InterpreterBase.BOOL_NODE}
+LITERAL_TYPES = {InterpreterBase.INT_NODE, InterpreterBase.STRING_NODE, InterpreterBase.BOOL_NODE}
+
+# gives a node built by the optimizer the source position of the node it replaces
+def located(node, source):
+    node.line_num = source.line_num
+    node.col_num = source.col_num
+    return node
+
+
+def optimize(program_ast):
+    functions = [optimize_func(func_ast) for func_ast in program_ast.functions]
+    return ProgramNode(program_ast.structs, functions)
+
+
+def optimize_func(func_ast):
+    return located(
+        FuncNode(func_ast.name, func_ast.args, func_ast.return_type, optimize_block(func_ast.statements)), func_ast
+    )
+
+
+def optimize_block(statements):
+    result = []
+    for statement in statements:
+        optimize_statement(statement, result)
+        if statement.elem_type in (InterpreterBase.RETURN_NODE, InterpreterBase.RAISE_NODE):
+            break  # nothing after this in the block can run
+    return result
+
+
+# appends the optimized form of statement (possibly nothing, possibly several statements) to out
+def optimize_statement(statement, out):
+    kind = statement.elem_type
+    if kind == "=":
+        out.append(located(AssignNode(statement.name, optimize_expr(statement.expression)), statement))
+    elif kind == InterpreterBase.FCALL_NODE:
+        out.append(optimize_expr(statement))
+    elif kind == InterpreterBase.RETURN_NODE:
+        expression = statement.expression
+        out.append(located(ReturnNode(None if expression is None else optimize_expr(expression)), statement))
+    elif kind == InterpreterBase.RAISE_NODE:
+        out.append(located(RaiseNode(optimize_expr(statement.exception_type)), statement))
+    elif kind == InterpreterBase.IF_NODE:
+        optimize_if(statement, out)
+    elif kind == InterpreterBase.FOR_NODE:
+        optimize_for(statement, out)
+    elif kind == InterpreterBase.TRY_NODE:
+        catchers = [located(CatchNode(c.exception_type, optimize_block(c.statements)), c) for c in statement.catchers]
+        out.append(located(TryNode(optimize_block(statement.statements), catchers), statement))
+    else:
+        out.append(statement)
+
+
+def optimize_if(if_ast, out):
+    condition = optimize_expr(if_ast.condition)
+    statements = optimize_block(if_ast.statements)
+    else_statements = None
+    if if_ast.else_statements is not None:
+        else_statements = optimize_block(if_ast.else_statements)
+    if condition.elem_type != InterpreterBase.BOOL_NODE:
+        out.append(located(IfNode(condition, statements, else_statements), if_ast))
+        return
+    taken = statements if condition.val else else_statements
+    if taken is None:
+        return
+    if any(s.elem_type == InterpreterBase.VAR_DEF_NODE for s in taken):
+        # the branch's variables need their own scope, so keep it as a block
+        true = located(LiteralNode(InterpreterBase.BOOL_NODE, True), condition)
+        out.append(located(IfNode(true, taken, None), if_ast))
+    else:
+        out.extend(taken)
+
+
+def optimize_for(for_ast, out):
+    condition = optimize_expr(for_ast.condition)
+    if condition.elem_type == InterpreterBase.BOOL_NODE and not condition.val:
+        optimize_statement(for_ast.init, out)  # the loop never runs, but its init still does
+        return
+    init = []
+    optimize_statement(for_ast.init, init)
+    update = []
+    optimize_statement(for_ast.update, update)
+    out.append(located(ForNode(init[0], condition, update[0], optimize_block(for_ast.statements)), for_ast))
+
+
+def optimize_expr(expr_ast):
+    kind = expr_ast.elem_type
+    if kind == InterpreterBase.FCALL_NODE:
+        return located(FCallNode(expr_ast.name, [optimize_expr(arg) for arg in expr_ast.args]), expr_ast)
+    if isinstance(expr_ast, UnaryOpNode):
+        return fold_unary(expr_ast, optimize_expr(expr_ast.op1))
+    if isinstance(expr_ast, BinaryOpNode):
+        return fold_binary(expr_ast, optimize_expr(expr_ast.op1), optimize_expr(expr_ast.op2))
+    return expr_ast
+
+
+def is_literal(node):
+    return node.elem_type in LITERAL_TYPES or node.elem_type == InterpreterBase.NIL_NODE
+
+
+def literal_value(node):
+    return None if node.elem_type == InterpreterBase.NIL_NODE else node.val
+
+
+def fold_unary(expr_ast, op1):
+    kind = expr_ast.elem_type
+    if kind == InterpreterBase.NEG_NODE and op1.elem_type == InterpreterBase.INT_NODE:
+        return located(LiteralNode(InterpreterBase.INT_NODE, -1 * op1.val), expr_ast)
+    if kind == InterpreterBase.NOT_NODE and op1.elem_type == InterpreterBase.BOOL_NODE:
+        return located(LiteralNode(InterpreterBase.BOOL_NODE, not op1.val), expr_ast)
+    return located(UnaryOpNode(kind, op1), expr_ast)
+
+
+def fold_binary(expr_ast, op1, op2):
+    kind = expr_ast.elem_type
+    if kind in ("||", "&&"):
+        if op1.elem_type != InterpreterBase.BOOL_NODE:
+            return located(BinaryOpNode(kind, op1, op2), expr_ast)
+        if op1.val == (kind == "||"):
+            return op1  # short-circuits; op2 is never evaluated
+        if op2.elem_type == InterpreterBase.BOOL_NODE:
+            return op2
+        return located(BinaryOpNode(kind, op1, op2), expr_ast)
+
+    if not is_literal(op1) or not is_literal(op2):
+        return located(BinaryOpNode(kind, op1, op2), expr_ast)
+    if kind in ("==", "!="):
+        # DOCUMENT: allow comparisons ==/!= of anything against anything
+        equal = op1.elem_type == op2.elem_type and literal_value(op1) == literal_value(op2)
+        return located(LiteralNode(InterpreterBase.BOOL_NODE, equal == (kind == "==")), expr_ast)
+    ops = ARITH_OPS.get(op1.elem_type, {})
+    if op1.elem_type != op2.elem_type or kind not in ops:
+        return located(BinaryOpNode(kind, op1, op2), expr_ast)  # type error, reported at runtime
+    if kind == "/" and op2.val == 0:
+        return located(BinaryOpNode(kind, op1, op2), expr_ast)  # raises div0 at runtime
+    return located(LiteralNode(RESULT_TYPES.get(kind, op1.elem_type), ops[kind](op1.val, op2.val)), expr_ast)
@@ -0,0 +1,78 @@
+import time
+
+# A Profiler records where a Brewin program spends its time. The interpreter reports every
+# function call, statement and thunk evaluation it runs to enter()/exit() (only when it was
+# given a profiler, so normal runs pay nothing). Each is identified by a key:
+#   (function name, "func", function name)      for a call of that function
+#   (function name, statement kind, label)      for a statement in that function
+#   (function name, "thunk", label)             for forcing a lazy expression created there
+# For each key the profiler keeps the number of calls (for a thunk, how often it was forced),
+# cumulative time (including everything it ran, counted once for recursive calls) and self
+# time (excluding the functions, statements and thunks it ran).
+#
+# Expressions aren't timed on their own: a closure per expression node would cost more than
+# most of them take to evaluate. Their time is counted as the self time of the statement (or
+# thunk) that evaluates them, apart from the calls and thunks they run, which have their own
+# keys. Profiling works by wrapping the compiled closures, so a profiled program always runs
+# on the closure backend; Interpreter(use_vm=True, profiler=...) doesn't use the VM.
+
+
+class NodeStats:
+    def __init__(self):
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        self.active = 0  # activations currently running, so recursion isn't counted twice
+
+
+class Profiler:
+    def __init__(self, timer=time.perf_counter):
+        self.timer = timer
+        self.stats = {}
+        self.frames = []  # [stats, start time, time spent in children] for each running node
+        self.stack = []  # names of the running functions and thunks, outermost first
+        self.collapsed = {}  # ";".join(stack) -> self time spent with exactly that stack
+
+    def enter(self, key, frame_name=None):
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = NodeStats()
+        stats.calls += 1
+        stats.active += 1
+        if frame_name is not None:
+            self.stack.append(frame_name)
+        self.frames.append([stats, self.timer(), 0.0, frame_name is not None])
+
+    def exit(self):
+        stats, start, child_time, is_frame = self.frames.pop()
+        elapsed = self.timer() - start
+        stats.active -= 1
+        if stats.active == 0:
+            stats.cumulative += elapsed
+        stats.self_time += elapsed - child_time
+        path = ";".join(self.stack)
+        self.collapsed[path] = self.collapsed.get(path, 0.0) + elapsed - child_time
+        if is_frame:
+            self.stack.pop()
+        if self.frames:
+            self.frames[-1][2] += elapsed
+
+    # returns (key, stats) pairs, most self time first
+    def hot_spots(self):
+        return sorted(self.stats.items(), key=lambda item: item[1].self_time, reverse=True)
+
+    # returns a table of the limit nodes with the most self time
+    def report(self, limit=20):
+        lines = [f"{'calls':>8} {'cumulative':>12} {'self':>12}  node"]
+        for (func_name, kind, label), stats in self.hot_spots()[:limit]:
+            node = func_name if kind == "func" else f"{func_name}: {label}"
+            lines.append(f"{stats.calls:>8} {stats.cumulative:>12.6f} {stats.self_time:>12.6f}  {node}")
+        return "\n".join(lines)
+
+    # writes self time per call stack in the collapsed format read by flamegraph.pl and
+    # speedscope ("main;fib;fib 1234"), in microseconds
+    def write_collapsed(self, file_name):
+        with open(file_name, "w", encoding="utf-8") as handle:
+            for path, seconds in sorted(self.collapsed.items()):
+                if path:
+                    handle.write(f"{path} {round(seconds * 1_000_000)}\n")
@@ -0,0 +1,115 @@
+from intbase import InterpreterBase
+
+# The Resolver walks a program's AST once, before it runs, and gives every variable a
+# lexical address: a (depth, slot) pair, where depth is the index of the block within the
+# function's environment (depth 0 holds the formal arguments, depth 1 the function body,
+# and each nested if/for/try/catch body adds one) and slot is the index of the variable
+# within that block. Because Brewin blocks run their statements in order, a reference
+# always resolves to the nearest definition that textually precedes it, which is exactly
+# the variable a dynamic lookup would have found at runtime.
+class Resolver:
+    def __init__(self, program_ast):
+        self.addresses = {}  # id(node) -> (depth, slot); None if unresolved or a duplicate definition
+        self.block_sizes = {}  # id(statement or argument list) -> number of slots in that block
+        for func_ast in program_ast.functions:
+            self.__resolve_func(func_ast)
+
+    # returns the (depth, slot) of a var, vardef, assignment or formal argument node.
+    # None means the variable isn't defined at that point (or, for a vardef, that it's
+    # a duplicate definition); those are reported as errors when they are reached
+    def address(self, node):
+        return self.addresses.get(id(node))
+
+    def block_size(self, block):
+        return self.block_sizes[id(block)]
+
+    # returns the var nodes in an expression that read a variable from the enclosing
+    # environment, i.e. the bindings a lazy evaluation of the expression needs
+    def free_vars(self, expr_ast):
+        free = []
+        self.__collect_free_vars(expr_ast, free)
+        return free
+
+    def __collect_free_vars(self, expr_ast, free):
+        if expr_ast.elem_type == InterpreterBase.VAR_NODE:
+            if self.address(expr_ast) is not None:
+                free.append(expr_ast)
+        elif expr_ast.elem_type == InterpreterBase.FCALL_NODE:
+            for arg_ast in expr_ast.args:
+                self.__collect_free_vars(arg_ast, free)
+        else:
+            for operand in ("op1", "op2"):
+                if expr_ast.get(operand) is not None:
+                    self.__collect_free_vars(expr_ast.get(operand), free)
+
+    def __resolve_func(self, func_ast):
+        args = func_ast.args
+        scope = {}
+        for formal_ast in args:
+            # duplicate parameter names share a slot; the last argument passed wins
+            arg_name = formal_ast.name
+            if arg_name not in scope:
+                scope[arg_name] = len(scope)
+            self.addresses[id(formal_ast)] = (0, scope[arg_name])
+        self.block_sizes[id(args)] = len(scope)
+        self.__resolve_block(func_ast.statements, [scope])
+
+    def __resolve_block(self, statements, scopes):
+        scopes.append({})
+        for statement in statements:
+            self.__resolve_statement(statement, scopes)
+        self.block_sizes[id(statements)] = len(scopes[-1])
+        scopes.pop()
+
+    def __resolve_statement(self, statement, scopes):
+        kind = statement.elem_type
+        if kind == InterpreterBase.VAR_DEF_NODE:
+            var_name = statement.name
+            block = scopes[-1]
+            if var_name in block:
+                self.addresses[id(statement)] = None
+            else:
+                block[var_name] = len(block)
+                self.addresses[id(statement)] = (len(scopes) - 1, block[var_name])
+        elif kind == "=":
+            self.__resolve_expr(statement.expression, scopes)
+            self.addresses[id(statement)] = self.__lookup(statement.name, scopes)
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__resolve_expr(statement, scopes)
+        elif kind == InterpreterBase.RETURN_NODE:
+            if statement.expression is not None:
+                self.__resolve_expr(statement.expression, scopes)
+        elif kind == InterpreterBase.RAISE_NODE:
+            self.__resolve_expr(statement.exception_type, scopes)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__resolve_expr(statement.condition, scopes)
+            self.__resolve_block(statement.statements, scopes)
+            if statement.else_statements is not None:
+                self.__resolve_block(statement.else_statements, scopes)
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__resolve_statement(statement.init, scopes)
+            self.__resolve_expr(statement.condition, scopes)
+            self.__resolve_statement(statement.update, scopes)
+            self.__resolve_block(statement.statements, scopes)
+        elif kind == InterpreterBase.TRY_NODE:
+            self.__resolve_block(statement.statements, scopes)
+            for catcher_ast in statement.catchers:
+                self.__resolve_block(catcher_ast.statements, scopes)
+
+    def __resolve_expr(self, expr_ast, scopes):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_NODE:
+            self.addresses[id(expr_ast)] = self.__lookup(expr_ast.name, scopes)
+        elif kind == InterpreterBase.FCALL_NODE:
+            for arg_ast in expr_ast.args:
+                self.__resolve_expr(arg_ast, scopes)
+        else:
+            for operand in ("op1", "op2"):
+                if expr_ast.get(operand) is not None:
+                    self.__resolve_expr(expr_ast.get(operand), scopes)
+
+    def __lookup(self, var_name, scopes):
+        for depth in range(len(scopes) - 1, -1, -1):
+            if var_name in scopes[depth]:
+                return (depth, scopes[depth][var_name])
+        return None
@@ -0,0 +1,107 @@
+from intbase import InterpreterBase
+
+# Strictness analysis: finds the assignments whose value is certainly forced by the very
+# next thing the function does, so the interpreter can evaluate them eagerly instead of
+# making a thunk. Running the expression a moment earlier, with nothing observable in
+# between, can't be told apart from running it lazily. An assignment x = e is strict when
+# the statement after it (or, at the end of a block, whatever runs after the block) starts
+# by forcing x, within the same try statements:
+#  - print(x ...), inputi(x)/inputs(x), if (x ...) and raise x ... force their expression's
+#    leading variables (see leading_vars) first
+#  - in a for loop, the condition runs right after the init and after the update, so a
+#    counter update like i = i + 1 is strict when the condition starts by reading i
+# Anything else (a call of a user function, a return, a var definition, ...) may do
+# something observable first, so an assignment before it stays lazy. That includes another
+# assignment y = x ...: it only stores a thunk, so if x = e raised right away, y would keep
+# its old value where lazily it would hold a thunk that raises when it's forced.
+
+LITERAL_NODES = {
+    InterpreterBase.NIL_NODE,
+    InterpreterBase.INT_NODE,
+    InterpreterBase.STRING_NODE,
+    InterpreterBase.BOOL_NODE,
+}
+BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+
+
+# appends to out the variables an expression reads, in order, before it does anything
+# else (apply an operator, call a function); forcing those first is exactly what
+# evaluating the expression would do. Returns whether evaluation goes past expr_ast
+# without doing anything else
+def leading_vars(expr_ast, out):
+    kind = expr_ast.elem_type
+    if kind in LITERAL_NODES:
+        return True
+    if kind == InterpreterBase.VAR_NODE:
+        out.append(expr_ast)
+        return True
+    if kind in BIN_OPS:
+        # || and && check their left operand before evaluating the right one
+        if leading_vars(expr_ast.op1, out) and kind != "||" and kind != "&&":
+            leading_vars(expr_ast.op2, out)
+    elif kind == InterpreterBase.NEG_NODE or kind == InterpreterBase.NOT_NODE:
+        leading_vars(expr_ast.op1, out)
+    return False
+
+
+# returns the var node an expression forces before anything else, or None
+def first_forced_var(expr_ast):
+    out = []
+    leading_vars(expr_ast, out)
+    return out[0] if out else None
+
+
+# returns the ids of the strict assignments in a function's statements
+def strict_assignments(statements, resolver):
+    strict = set()
+    analyze_block(statements, None, resolver, strict)
+    return strict
+
+
+# after is the var node forced first by whatever runs right after the block, or None
+def analyze_block(statements, after, resolver, strict):
+    forced_next = after
+    for statement in reversed(statements):
+        kind = statement.elem_type
+        if kind == "=":
+            analyze_assignment(statement, forced_next, resolver, strict)
+        elif kind == InterpreterBase.IF_NODE:
+            analyze_block(statement.statements, forced_next, resolver, strict)
+            if statement.else_statements is not None:
+                analyze_block(statement.else_statements, forced_next, resolver, strict)
+        elif kind == InterpreterBase.FOR_NODE:
+            condition_var = first_forced_var(statement.condition)
+            analyze_assignment(statement.init, condition_var, resolver, strict)
+            analyze_assignment(statement.update, condition_var, resolver, strict)
+            analyze_block(statement.statements, None, resolver, strict)  # the update is an assignment
+        elif kind == InterpreterBase.TRY_NODE:
+            # an exception from the end of the try block would be caught by its catchers, and
+            # one from the statement after it wouldn't, so it can't be raised any earlier
+            analyze_block(statement.statements, None, resolver, strict)
+            for catcher_ast in statement.catchers:
+                analyze_block(catcher_ast.statements, forced_next, resolver, strict)
+        forced_next = forced_first(statement)
+
+
+def analyze_assignment(assign_ast, forced_next, resolver, strict):
+    if assign_ast.elem_type != "=" or forced_next is None:
+        return
+    address = resolver.address(assign_ast)
+    if address is not None and address == resolver.address(forced_next):
+        strict.add(id(assign_ast))
+
+
+# returns the var node a statement forces before anything else when it runs, or None
+def forced_first(statement):
+    kind = statement.elem_type
+    if kind == InterpreterBase.FCALL_NODE:
+        if statement.name == "print" and statement.args:
+            return first_forced_var(statement.args[0])
+        if (statement.name == "inputi" or statement.name == "inputs") and len(statement.args) == 1:
+            return first_forced_var(statement.args[0])
+        return None
+    if kind == InterpreterBase.IF_NODE:
+        return first_forced_var(statement.condition)
+    if kind == InterpreterBase.RAISE_NODE:
+        return first_forced_var(statement.exception_type)
+    return None
@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import brewparse
+from element import Element
+from nodes import make_node
+
+PROGRAM = 'func main() { print("hello"); }'
+CHANGED_PROGRAM = 'func main() { print("goodbye"); }'
+
+# run in a fresh process: reports whether PROGRAM was already in the AST cache before parsing it
+CHECK_DISK_HIT = f"""
+import brewparse
+key = brewparse.ast_cache.key({PROGRAM!r})
+print(brewparse.ast_cache.get(key) is not None)
+brewparse.parse_program({PROGRAM!r})
+"""
+
+
+def printed_string(ast):
+    return ast.get("functions")[0].get("statements")[0].get("args")[0].get("val")
+
+
+class ASTCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_cache = brewparse.ast_cache
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        brewparse.ast_cache = self.saved_cache
+        self.temp_dir.cleanup()
+
+    def test_memory_hit_and_miss(self):
+        brewparse.configure_ast_cache()
+        ast = brewparse.parse_program(PROGRAM)
+        self.assertIs(brewparse.parse_program(PROGRAM), ast)
+        brewparse.ast_cache.clear()
+        reparsed = brewparse.parse_program(PROGRAM)
+        self.assertIsNot(reparsed, ast)
+        self.assertEqual(printed_string(reparsed), "hello")
+
+    def test_changed_source_is_a_miss(self):
+        brewparse.configure_ast_cache()
+        ast = brewparse.parse_program(PROGRAM)
+        changed = brewparse.parse_program(CHANGED_PROGRAM)
+        self.assertIsNot(changed, ast)
+        self.assertEqual(printed_string(ast), "hello")
+        self.assertEqual(printed_string(changed), "goodbye")
+
+    def test_node_factories_are_cached_separately(self):
+        brewparse.configure_ast_cache()
+        elements = brewparse.parse_program(PROGRAM)
+        nodes = brewparse.parse_program(PROGRAM, make_node)
+        self.assertIsInstance(elements, Element)
+        self.assertNotIsInstance(nodes, Element)
+        self.assertIs(brewparse.parse_program(PROGRAM, make_node), nodes)
+        self.assertNotEqual(brewparse.ast_cache.key(PROGRAM), brewparse.ast_cache.key(PROGRAM, make_node))
+
+    def test_least_recently_used_is_evicted(self):
+        brewparse.configure_ast_cache(max_entries=2)
+        programs = [f"func main() {{ print({i}); }}" for i in range(3)]
+        first = brewparse.parse_program(programs[0])
+        brewparse.parse_program(programs[1])
+        self.assertIs(brewparse.parse_program(programs[0]), first)  # now the most recently used
+        brewparse.parse_program(programs[2])
+        self.assertIsNone(brewparse.ast_cache.get(brewparse.ast_cache.key(programs[1])))
+        self.assertIs(brewparse.ast_cache.get(brewparse.ast_cache.key(programs[0])), first)
+
+    def test_disk_hit_and_miss(self):
+        brewparse.configure_ast_cache(cache_dir=self.temp_dir.name)
+        brewparse.parse_program(PROGRAM)
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 1)
+        brewparse.ast_cache.clear()
+        key = brewparse.ast_cache.key(PROGRAM)
+        from_disk = brewparse.ast_cache.get(key)
+        self.assertIsNotNone(from_disk)
+        self.assertEqual(printed_string(from_disk), "hello")
+        self.assertIsNone(brewparse.ast_cache.get(brewparse.ast_cache.key(CHANGED_PROGRAM)))
+
+    def test_unreadable_disk_entry_is_a_miss(self):
+        brewparse.configure_ast_cache(cache_dir=self.temp_dir.name)
+        key = brewparse.ast_cache.key(PROGRAM)
+        with open(os.path.join(self.temp_dir.name, key + ".pickle"), "wb") as handle:
+            handle.write(b"not a pickle")
+        self.assertIsNone(brewparse.ast_cache.get(key))
+        self.assertEqual(printed_string(brewparse.parse_program(PROGRAM)), "hello")
+
+    def test_cache_dir_is_shared_between_processes(self):
+        env = dict(os.environ, BREWIN_AST_CACHE_DIR=self.temp_dir.name)
+        here = os.path.dirname(os.path.abspath(__file__))
+        runs = [
+            subprocess.run(
+                [sys.executable, "-c", CHECK_DISK_HIT], env=env, cwd=here,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+            for _ in range(2)
+        ]
+        self.assertEqual(runs, ["False", "True"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import unittest
+
+import interpreterv4
+from intbase import (
+    FileSink, HashingSink, IteratorInput, ListInput, ListSink, OutputSink, RingBufferSink, StreamInput,
+)
+
+
+# reads everything written to the pipe so far (the write end must still be open)
+def read_pipe(fd):
+    os.set_blocking(fd, False)
+    try:
+        return os.read(fd, 1 << 20)
+    except BlockingIOError:
+        return b""
+
+
+class SinkTest(unittest.TestCase):
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def test_sinks_share_the_output_sink_interface(self):
+        sinks = [ListSink(), RingBufferSink(), HashingSink(), FileSink(self.write_fd)]
+        for sink in sinks:
+            self.assertIsInstance(sink, OutputSink)
+            sink.flush()
+        self.assertEqual(OutputSink().lines(), [])
+        self.assertEqual(HashingSink().lines(), [])
+
+    def test_list_sink(self):
+        sink = ListSink()
+        sink.write("a")
+        sink.write(1)
+        self.assertEqual(sink.lines(), ["a", 1])
+        sink.reset()
+        self.assertEqual(sink.lines(), [])
+
+    def test_ring_buffer_sink_keeps_last_lines(self):
+        sink = RingBufferSink(capacity=3)
+        for i in range(10):
+            sink.write(str(i))
+        self.assertEqual(sink.lines(), ["7", "8", "9"])
+        sink.reset()
+        self.assertEqual(sink.lines(), [])
+        sink.write("x")
+        self.assertEqual(sink.lines(), ["x"])
+
+    def test_hashing_sink(self):
+        sink = HashingSink()
+        sink.write("a")
+        sink.write("b")
+        self.assertEqual(sink.line_count, 2)
+        self.assertEqual(sink.hexdigest(), hashlib.sha256(b"a\nb\n").hexdigest())
+        self.assertEqual(sink.lines(), [])
+        sink.reset()
+        self.assertEqual(sink.line_count, 0)
+        self.assertEqual(sink.hexdigest(), hashlib.sha256(b"").hexdigest())
+
+    def test_file_sink_buffers_until_full(self):
+        sink = FileSink(self.write_fd, buffer_size=8)
+        sink.write("abc")
+        self.assertEqual(read_pipe(self.read_fd), b"")
+        sink.write("defg")
+        self.assertEqual(read_pipe(self.read_fd), b"abc\ndefg\n")
+        sink.write("h")
+        sink.flush()
+        self.assertEqual(read_pipe(self.read_fd), b"h\n")
+        self.assertEqual(sink.lines(), [])
+
+    def test_file_sink_reset_writes_buffered_lines(self):
+        sink = FileSink(self.write_fd)
+        sink.write("kept")
+        sink.reset()
+        self.assertEqual(read_pipe(self.read_fd), b"kept\n")
+
+    def test_interpreter_flushes_file_sink_after_run(self):
+        interpreter = interpreterv4.Interpreter(False, None, False)
+        interpreter.set_output_sink(FileSink(self.write_fd))
+        interpreter.run('func main() { print("a"); print("b"); }')
+        self.assertEqual(read_pipe(self.read_fd), b"a\nb\n")
+        with self.assertRaises(Exception):
+            interpreter.run('func main() { print("c"); print(1 + "d"); }')
+        self.assertEqual(read_pipe(self.read_fd), b"c\n")
+
+
+class InputTest(unittest.TestCase):
+    def test_list_input(self):
+        provider = ListInput(["1", "2"])
+        self.assertEqual([provider.read(), provider.read(), provider.read()], ["1", "2", None])
+        provider.reset()
+        self.assertEqual(provider.read(), "1")
+
+    def test_stream_input_splits_lines_across_reads(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b"12\n345\n\n6")
+        os.close(write_fd)
+        provider = StreamInput(read_fd, buffer_size=2)
+        try:
+            values = [provider.read() for _ in range(5)]
+        finally:
+            os.close(read_fd)
+        self.assertEqual(values, ["12", "345", "", "6", None])
+
+    def test_stream_input_file_object(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b"a\nb\n")
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as handle:
+            provider = StreamInput(handle)
+            self.assertEqual([provider.read(), provider.read(), provider.read()], ["a", "b", None])
+
+    def test_iterator_input(self):
+        provider = IteratorInput(i * i for i in range(3))
+        self.assertEqual([provider.read() for _ in range(4)], ["0", "1", "4", None])
+
+    def test_interpreter_reads_from_provider(self):
+        interpreter = interpreterv4.Interpreter(False, None, False)
+        interpreter.set_input_provider(IteratorInput(range(1, 4)))
+        interpreter.run("func main() { print(inputi() + inputi() + inputi()); }")
+        self.assertEqual(interpreter.get_output(), ["6"])
+
+
+if __name__ == "__main__":
+    unittest.main()
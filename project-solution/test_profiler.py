@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+import interpreterv4
+from profiler_v4 import Profiler
+
+
+# a timer whose time only moves when the test advances it
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+MAIN = ("main", "func", "main")
+FIB = ("fib", "func", "fib")
+PRINT = ("main", "fcall", "print")
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.profiler = Profiler(timer=self.clock)
+
+    # main runs for 1s itself, calls print (2s), then runs another 3s itself
+    def run_main_with_print(self):
+        self.profiler.enter(MAIN, "main")
+        self.clock.advance(1)
+        self.profiler.enter(PRINT)
+        self.clock.advance(2)
+        self.profiler.exit()
+        self.clock.advance(3)
+        self.profiler.exit()
+
+    def test_counts_calls(self):
+        for _ in range(3):
+            self.run_main_with_print()
+        self.assertEqual(self.profiler.stats[MAIN].calls, 3)
+        self.assertEqual(self.profiler.stats[PRINT].calls, 3)
+
+    def test_self_and_cumulative_time(self):
+        self.run_main_with_print()
+        main, call = self.profiler.stats[MAIN], self.profiler.stats[PRINT]
+        self.assertEqual((main.cumulative, main.self_time), (6, 4))
+        self.assertEqual((call.cumulative, call.self_time), (2, 2))
+        self.assertEqual([key for key, _ in self.profiler.hot_spots()], [MAIN, PRINT])
+
+    def test_recursion_is_counted_once_in_cumulative_time(self):
+        # main -> fib -> fib, each spending 1s itself
+        self.profiler.enter(MAIN, "main")
+        self.clock.advance(1)
+        self.profiler.enter(FIB, "fib")
+        self.clock.advance(1)
+        self.profiler.enter(FIB, "fib")
+        self.clock.advance(1)
+        self.profiler.exit()
+        self.profiler.exit()
+        self.profiler.exit()
+        fib = self.profiler.stats[FIB]
+        self.assertEqual(fib.calls, 2)
+        self.assertEqual(fib.cumulative, 2)
+        self.assertEqual(fib.self_time, 2)
+        self.assertEqual(fib.active, 0)
+        self.assertEqual(self.profiler.stats[MAIN].cumulative, 3)
+
+    def test_report(self):
+        self.run_main_with_print()
+        lines = self.profiler.report().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith("  main"))
+        self.assertTrue(lines[2].endswith("  main: print"))
+        self.assertEqual(len(self.profiler.report(limit=1).splitlines()), 2)
+
+    def test_write_collapsed(self):
+        # statements don't have their own frame, so print's time is main's in the call stacks
+        self.run_main_with_print()
+        self.profiler.enter(MAIN, "main")
+        self.profiler.enter(FIB, "fib")
+        self.clock.advance(0.000002)
+        self.profiler.exit()
+        self.profiler.exit()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_name = os.path.join(temp_dir, "out.collapsed")
+            self.profiler.write_collapsed(file_name)
+            with open(file_name, encoding="utf-8") as handle:
+                self.assertEqual(handle.read(), "main 6000000\nmain;fib 2\n")
+
+
+class InterpreterProfilingTest(unittest.TestCase):
+    PROGRAM = """
+func f(n) { if (n == 0) { return 0; } return f(n - 1); }
+func main() { print(f(3)); }
+"""
+
+    def test_interpreter_reports_calls_and_statements(self):
+        profiler = Profiler()
+        interpreter = interpreterv4.Interpreter(False, None, False, use_vm=True, profiler=profiler)
+        interpreter.run(self.PROGRAM)
+        self.assertFalse(interpreter.use_vm)
+        self.assertEqual(interpreter.get_output(), ["0"])
+        calls = {key: stats.calls for key, stats in profiler.stats.items()}
+        self.assertEqual(calls[MAIN], 1)
+        self.assertEqual(calls[("f", "func", "f")], 4)
+        self.assertEqual(calls[("f", "if", "if line 2:13")], 4)
+        self.assertIn("main;f", profiler.collapsed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,11 +36,21 @@ class Value(ValueBase):
     
     def __str__(self) -> str:
         return f"Value({self.t}, {self.v})"
+
+    # Values are never modified once created, so a copy can share the original (this is
+    # what keeps the interned values below from being duplicated when passed or returned)
+    def __copy__(self):
+        return self
     
+# A not-yet-evaluated expression. top_env holds only the bindings the expression reads,
+# captured when the LazyValue was created (see Interpreter.__compile_lazy_expr); leading
+# are the indices of the bindings its evaluation forces before doing anything else
 class LazyValue(ValueBase):
-    def __init__(self, ast_expr, top_env):
+    def __init__(self, ast_expr, top_env, code=None, leading=()):
         self.ast_expr = ast_expr
         self.top_env = top_env
+        self.eval_code = code  # compiled closure that evaluates ast_expr
+        self.leading = leading
         self.eval = False
         self.v = None
         self.t = None
@@ -48,6 +58,7 @@ class LazyValue(ValueBase):
     def set_type_value(self, t, v):
         self.eval = True
         self.top_env = None
+        self.eval_code = None
         self.t = t
         self.v = v
 
@@ -69,20 +80,56 @@ class LazyValue(ValueBase):
     
     def ast(self):
         return self.ast_expr
+
+    def code(self):
+        return self.eval_code
+
+    # a LazyValue is the memo cell for its expression: passing or returning it shares the
+    # cell, so the expression is evaluated at most once however many aliases it has
+    def __copy__(self):
+        return self
     
 
 
+# Canonical Values for true, false and nil, and for ints in [small_int_min, small_int_max].
+# bool_value/int_value return these instead of allocating a new Value each time
+TRUE_VALUE = Value(Type.BOOL, True)
+FALSE_VALUE = Value(Type.BOOL, False)
+NIL_VALUE = Value(Type.NIL, None)
+
+small_int_min = -128
+small_int_max = 1024
+small_ints = [Value(Type.INT, i) for i in range(small_int_min, small_int_max + 1)]
+
+
+# changes the range of ints that int_value interns
+def configure_small_ints(low=-128, high=1024):
+    global small_int_min, small_int_max, small_ints
+    small_int_min, small_int_max = low, high
+    small_ints = [Value(Type.INT, i) for i in range(low, high + 1)]
+
+
+def bool_value(b):
+    return TRUE_VALUE if b else FALSE_VALUE
+
+
+def int_value(i):
+    if small_int_min <= i <= small_int_max:
+        return small_ints[i - small_int_min]
+    return Value(Type.INT, i)
+
+
 def create_value(val):
     if val == InterpreterBase.TRUE_DEF:
-        return Value(Type.BOOL, True)
+        return TRUE_VALUE
     elif val == InterpreterBase.FALSE_DEF:
-        return Value(Type.BOOL, False)
+        return FALSE_VALUE
     elif val == InterpreterBase.NIL_DEF:
-        return Value(Type.NIL, None)
+        return NIL_VALUE
     elif isinstance(val, str):
         return Value(Type.STRING, val)
     elif isinstance(val, int):
-        return Value(Type.INT, val)
+        return int_value(val)
     else:
         raise ValueError("Unknown value type")
 
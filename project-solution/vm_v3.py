@@ -0,0 +1,123 @@
+import copy
+
+from bytecode_v3 import *
+from type_valuev3 import TypeManager
+
+
+# An activation record for a Brewin function call; its variables are the function's
+# environment in the interpreter's EnvironmentManager
+class Frame:
+    def __init__(self, code, return_type):
+        self.code = code
+        self.return_type = return_type
+        self.stack = []
+        self.pc = 0
+
+
+# A stack-based VM that runs the bytecode produced by BytecodeCompiler with the same
+# semantics as the tree-walking interpreter. Brewin calls push Frames onto an explicit
+# frame stack instead of recursing in Python, so recursion depth is limited only by memory.
+class VM:
+    # interpreter provides the checks and operations shared with the tree-walking interpreter,
+    # its env and type_manager, and error/output; get_func_code(func_ast) returns a function's code
+    def __init__(self, interpreter, get_func_code):
+        self.interpreter = interpreter
+        self.get_func_code = get_func_code
+
+    # runs a function that takes no arguments (main) until it returns; returns its return value
+    def run(self, func_ast):
+        interpreter = self.interpreter
+        env = interpreter.env
+        get_variable = interpreter.get_variable
+        eval_binary = interpreter.eval_binary
+        get_func_code = self.get_func_code
+
+        env.push_func()
+        frames = [Frame(get_func_code(func_ast), func_ast.get("return_type"))]
+        frame = frames[-1]
+        instructions = frame.code.instructions
+        stack = frame.stack
+        pc = 0
+        while True:
+            op, arg = instructions[pc]
+            pc += 1
+
+            if op == LOAD_VAR:
+                stack.append(get_variable(arg).value())
+            elif op == LOAD_CONST:
+                stack.append(arg)
+            elif op == BINARY:
+                right = stack.pop()
+                stack[-1] = eval_binary(arg, stack[-1], right)
+            elif op == JUMP_IF_FALSE:
+                cond = stack.pop()
+                interpreter.check_condition(cond, arg[1])
+                if not cond.value():
+                    pc = arg[0]
+            elif op == JUMP:
+                pc = arg
+            elif op == LOAD_VARIABLE:
+                stack.append(get_variable(arg))
+            elif op == ASSIGN:
+                value_obj = stack.pop()
+                interpreter.assign_value(stack.pop(), value_obj)
+            elif op == PUSH_BLOCK:
+                env.push_block()
+            elif op == POP_BLOCK:
+                env.pop_block()
+            elif op == DEF_VAR:
+                interpreter.define_var(*arg)
+            elif op == BIND_ARG:
+                stack[-1] = interpreter.bind_arg(arg, copy.copy(stack[-1]))
+            elif op == CALL:
+                callee_ast, num_args = arg
+                args = {}
+                if num_args:
+                    for formal_ast, variable in zip(callee_ast.get("args"), stack[-num_args:]):
+                        args[formal_ast.get("name")] = variable
+                    del stack[-num_args:]
+                # create the new activation record and add the formal arguments to it
+                env.push_func()
+                for arg_name, variable in args.items():
+                    env.create(arg_name, variable)
+                frame.pc = pc
+                frame = Frame(get_func_code(callee_ast), callee_ast.get("return_type"))
+                frames.append(frame)
+                instructions, stack, pc = frame.code.instructions, frame.stack, 0
+            elif op == RETURN or op == RETURN_DEFAULT:
+                if op == RETURN:
+                    result = interpreter.check_return_value(frame.return_type, copy.copy(stack.pop()))
+                else:
+                    result = interpreter.type_manager.create_default_value(frame.return_type)
+                env.pop_func()
+                frames.pop()
+                if not frames:
+                    return result
+                frame = frames[-1]
+                instructions, stack, pc = frame.code.instructions, frame.stack, frame.pc
+                stack.append(result)
+            elif op == POP:
+                stack.pop()
+            elif op == NEW:
+                stack.append(interpreter.new_struct(arg))
+            elif op == NEG:
+                stack[-1] = interpreter.eval_neg(arg, stack[-1])
+            elif op == NOT:
+                stack[-1] = interpreter.eval_not(arg, stack[-1])
+            elif op == CHECK_ARG:
+                interpreter.check_builtin_arg(stack[-1])
+            elif op == PRINT:
+                output = ""
+                if arg:
+                    for value_obj in stack[-arg:]:
+                        output = output + TypeManager.get_printable(value_obj)  # DOCUMENT need to be able to print "nil" now, undefined for a struct
+                    del stack[-arg:]
+                interpreter.output(output)
+                stack.append(interpreter.VOID_VALUE)
+            elif op == INPUT:
+                name, has_prompt = arg
+                if has_prompt:
+                    interpreter.output(TypeManager.get_printable(stack.pop()))
+                stack.append(interpreter.read_input(name))
+            elif op == FAIL:
+                interpreter.error(*arg)
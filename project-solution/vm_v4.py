@@ -0,0 +1,208 @@
+from bytecode_v4 import *
+from intbase import ErrorType
+from type_valuev4 import Type, Value, LazyValue, get_printable, int_value
+
+
+# An activation record: a function call, or the evaluation of a thunk (in which case
+# thunk is the LazyValue being forced and locals are the bindings it captured)
+class Frame:
+    __slots__ = ("code", "locals", "stack", "pc", "thunk")
+
+    def __init__(self, code, local_vars, thunk=None):
+        self.code = code
+        self.locals = local_vars
+        self.stack = []
+        self.pc = 0
+        self.thunk = thunk
+
+
+# A stack-based VM that runs the bytecode produced by BytecodeCompiler with the same
+# semantics as the tree-walking interpreter: lazy values, try/catch/raise and div0.
+# Brewin calls and thunk evaluations push Frames onto an explicit frame stack instead of
+# recursing in Python, and exceptions unwind that stack using each Code's handler table.
+#
+# use_vm is a deep-recursion mode, not a performance feature. What the VM buys is that
+# stack: a Brewin program can recurse as deep as memory allows, where the closure backend
+# runs out of Python stack a few hundred non-tail calls deep (fewer when the calls pass
+# closures or thunks around). It is not faster than the closures: under CPython a trip
+# around the dispatch loop costs about as much as the closure call it replaces, and on the
+# programs in benchmarks/v4 the two backends are within about 30% of each other, with
+# neither consistently ahead. Use the closures unless a program needs the depth.
+class VM:
+    DIV_ZERO = Value(Type.STRING, "div0")
+
+    # interpreter provides error/output/get_input, binary_ops and report_op_error;
+    # get_func_code(name, num_args, line) returns (slot of each formal arg, code) for a user function
+    def __init__(self, interpreter, get_func_code):
+        self.interpreter = interpreter
+        self.get_func_code = get_func_code
+
+    # runs code until its frame returns; returns the uncaught exception's Value, or None
+    def run(self, code):
+        interpreter = self.interpreter
+        binary_ops = interpreter.binary_ops
+        get_func_code = self.get_func_code
+        unwind = VM.__unwind
+
+        frames = [Frame(code, [None] * code.num_locals)]
+        frame = frames[-1]
+        instructions = frame.code.instructions
+        stack = frame.stack
+        local_vars = frame.locals
+        pc = 0
+        handling = None  # the exception whose handler is running
+        # the most frequent opcodes are tested first
+        while True:
+            op, arg = instructions[pc]
+            pc += 1
+
+            if op == LOAD_VAR:
+                val = local_vars[arg]
+                if val.evaluated():
+                    stack.append(val)
+                else:
+                    # force it: run the thunk's code in a frame of its own, which pushes the value here when it returns
+                    frame.pc = pc
+                    frame = Frame(val.eval_code, val.top_env, val)
+                    frames.append(frame)
+                    instructions, stack, local_vars, pc = frame.code.instructions, frame.stack, frame.locals, 0
+            elif op == LOAD_CONST:
+                stack.append(arg)
+            elif op == BINARY:
+                right = stack.pop()
+                left = stack[-1]
+                # arg is the instruction's inline cache: [operator, left type, right type, function, line]
+                if left.t != arg[1] or right.t != arg[2]:
+                    f = binary_ops.get((arg[0], left.t, right.t))
+                    if f is None:
+                        interpreter.report_op_error(arg[0], left.t, right.t, arg[4])
+                    arg[1], arg[2], arg[3] = left.t, right.t, f
+                if arg[0] == "/" and right.v == 0:  # document div0 exception
+                    handling = VM.DIV_ZERO
+                    frame, pc = unwind(frames, pc, handling)
+                    if frame is None:
+                        return handling
+                    instructions, stack, local_vars = frame.code.instructions, frame.stack, frame.locals
+                else:
+                    stack[-1] = arg[3](left.v, right.v)
+            elif op == STORE:
+                local_vars[arg] = stack.pop()
+            elif op == JUMP_IF_FALSE:
+                cond = stack.pop()
+                if cond.t != Type.BOOL:
+                    interpreter.error(ErrorType.TYPE_ERROR, arg[1], arg[2])
+                if not cond.v:
+                    pc = arg[0]
+            elif op == MAKE_THUNK:
+                expr_ast, thunk_code, captured = arg
+                stack.append(LazyValue(expr_ast, [local_vars[i] for i in captured], thunk_code))
+            elif op == LOAD_VAR_LAZY:
+                stack.append(local_vars[arg])
+            elif op == FORCE:
+                val = stack[-1]
+                if not val.evaluated():
+                    stack.pop()
+                    frame.pc = pc
+                    frame = Frame(val.eval_code, val.top_env, val)
+                    frames.append(frame)
+                    instructions, stack, local_vars, pc = frame.code.instructions, frame.stack, frame.locals, 0
+            elif op == CALL:
+                # arg is [name, number of args, line, arg slots, code]; the callee is looked up once
+                func_code = arg[4]
+                if func_code is None:
+                    arg[3], arg[4] = get_func_code(arg[0], arg[1], arg[2])
+                    func_code = arg[4]
+                num_args = arg[1]
+                new_locals = [None] * func_code.num_locals
+                if num_args:
+                    for slot, actual_arg in zip(arg[3], stack[-num_args:]):
+                        new_locals[slot] = actual_arg
+                    del stack[-num_args:]
+                frame.pc = pc
+                frame = Frame(func_code, new_locals)
+                frames.append(frame)
+                instructions, stack, local_vars, pc = func_code.instructions, frame.stack, new_locals, 0
+            elif op == RETURN or op == THUNK_RETURN or op == RETURN_NIL:
+                if op == RETURN:
+                    result = stack.pop()
+                elif op == THUNK_RETURN:
+                    result = stack.pop()
+                    frame.thunk.set_type_value(result.t, result.v)
+                else:
+                    result = interpreter.NIL_VALUE
+                frames.pop()
+                if not frames:
+                    return None
+                frame = frames[-1]
+                instructions, stack, local_vars, pc = frame.code.instructions, frame.stack, frame.locals, frame.pc
+                stack.append(result)
+            elif op == JUMP:
+                pc = arg
+            elif op == POP:
+                stack.pop()
+            elif op == DEF_VAR:
+                local_vars[arg] = interpreter.NIL_VALUE
+            elif op == LOGICAL_CHECK:
+                if stack[-1].type() != Type.BOOL:
+                    interpreter.error(ErrorType.TYPE_ERROR, f"Incompatible type for {arg[0]} operation", arg[1])
+            elif op == SHORT_CIRCUIT:
+                if stack[-1].value() == arg[0]:
+                    pc = arg[1]
+                else:
+                    stack.pop()
+            elif op == UNARY:
+                oper, t, f, line_num = arg
+                val = stack.pop()
+                if val.type() != t:
+                    interpreter.error(ErrorType.TYPE_ERROR, f"Incompatible type for {oper} operation", line_num)
+                stack.append(f(val.value()))
+            elif op == PRINT:
+                # document that print is all or nothing. if an exception occurs, then the output is not printed
+                output = ""
+                if arg:
+                    for val in stack[-arg:]:
+                        output = output + get_printable(val)
+                    del stack[-arg:]
+                interpreter.output(output)
+                stack.append(interpreter.NIL_VALUE)
+            elif op == INPUT:
+                name, has_prompt = arg
+                if has_prompt:
+                    interpreter.output(get_printable(stack.pop()))
+                inp = interpreter.get_input()
+                if name == "inputi":
+                    stack.append(int_value(int(inp)))
+                else:
+                    stack.append(Value(Type.STRING, inp))
+            elif op == RAISE:
+                # document that raise argument evaluation is eager
+                val = stack.pop()
+                if val.type() != Type.STRING:
+                    interpreter.error(ErrorType.TYPE_ERROR, f"Invalid type for raise argument: {val.type()}", arg)
+                handling = val
+                frame, pc = unwind(frames, pc, handling)
+                if frame is None:
+                    return handling
+                instructions, stack, local_vars = frame.code.instructions, frame.stack, frame.locals
+            elif op == RERAISE:
+                frame, pc = unwind(frames, arg + 1, handling)
+                if frame is None:
+                    return handling
+                instructions, stack, local_vars = frame.code.instructions, frame.stack, frame.locals
+            elif op == FAIL:
+                interpreter.error(*arg)
+
+    # unwinds frames to the innermost catch clause for exception, raised by the instruction
+    # before pc in the top frame; thunks that raise stay unevaluated. Returns the frame to
+    # resume and its handler's pc, or (None, None) if nothing catches the exception
+    @staticmethod
+    def __unwind(frames, pc, exception):
+        frames[-1].pc = pc
+        while frames:
+            frame = frames[-1]
+            handler = frame.code.find_handler(frame.pc - 1, exception.value())
+            if handler is not None:
+                frame.stack.clear()
+                return frame, handler
+            frames.pop()
+        return None, None
@@ -129,8 +129,14 @@ def t_error(t):
     print(f"Illegal character {t.value[0]}")
     t.lexer.skip(1)
 
-def reset_lineno():
-    lexer.lineno = 1
+# The lexer is built the first time it's needed rather than at import time
+lexer = None
+
+def get_lexer():
+    global lexer
+    if lexer is None:
+        lexer = lex.lex()
+    return lexer
 
-# Build the lexer
-lexer = lex.lex()
+def reset_lineno():
+    get_lexer().lineno = 1
@@ -4,8 +4,11 @@ test management.
 """
 
 import asyncio
+import io
 import json
-from os import makedirs
+import multiprocessing
+from contextlib import redirect_stderr, redirect_stdout
+from os import getpid, makedirs, replace
 from os.path import exists
 from abc import ABC, abstractmethod
 
@@ -21,20 +24,33 @@ class AbstractTestScaffold(ABC):
     def run_test_case(self, test_case, environment):
         """Run the test case end-to-end; return a number encoding the points allocated."""
 
+    def warm_up(self):
+        """
+        Optional one-time preparation (e.g. loading the implementation), done in each WorkerPool
+        worker and before per-test processes are started.
+        """
+
+    def cache_key(self, test_case):  # pylint: disable=unused-argument
+        """
+        Optional key for a ResultCache: a string that changes whenever the test case's result
+        could. None (the default) means the test case is never cached.
+        """
+        return None
+
 
 def run_test(scaffold, test_case):
-    """Ran a single test case with the scaffold; returns score."""
+    """Ran a single test case with the scaffold; returns score, or None if the test crashed."""
     environment = scaffold.setup(test_case)
     try:
         return scaffold.run_test_case(test_case, environment)
     except Exception as exception:  # pylint: disable=broad-except
         print(f"Exception during test: {exception}")
-        return 0
+        return None
 
 
 async def run_test_wrapper(interpreter, test_case, timeout):
     """
-    Wrapper for run_test with timeout and minor debugging.
+    Wrapper for run_test with timeout and minor debugging; returns None if the test timed out.
     Uses asyncio to enforce timeout, not for concurrency.
     """
     print(f'Running {test_case["srcfile"]}... ', end="")
@@ -45,25 +61,249 @@ async def run_test_wrapper(interpreter, test_case, timeout):
             return result
     except asyncio.TimeoutError:
         print("TIMED OUT")
-        return 0
+        return None
+
+
+def run_test_in_process(scaffold, test_case, connection):
+    """
+    Process entry point for run_test; sends back (score, captured stdout/stderr).
+    The scaffold must be picklable when processes are spawned rather than forked.
+    """
+    log = io.StringIO()
+    with redirect_stdout(log), redirect_stderr(log):
+        result = run_test(scaffold, test_case)
+    connection.send((result, log.getvalue()))
+    connection.close()
 
 
-async def run_all_tests(interpreter, tests, timeout_per_test=5, zero_credit=False):
+async def run_test_process_wrapper(interpreter, test_case, timeout, slots):
+    """
+    Run a single test case in its own process, at most len(slots) at a time; returns None
+    if it timed out or crashed. Unlike run_test_wrapper, a test that times out is killed
+    rather than left running. Starting the process takes longer than most tests run, so
+    this only beats running tests sequentially when they are slow; a WorkerPool avoids it.
+    """
+    async with slots:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=run_test_in_process, args=(interpreter, test_case, sender), daemon=True
+        )
+        process.start()
+        sender.close()
+        try:
+            finished = await asyncio.to_thread(receiver.poll, timeout)
+            result, log = receiver.recv() if finished else (None, "")
+        except EOFError:  # the process died without reporting a result
+            finished, result, log = True, None, ""
+        finally:
+            if process.is_alive() and not finished:
+                process.kill()
+            await asyncio.to_thread(process.join)
+            receiver.close()
+
+    print_test_report(test_case, finished, result, log)
+    return result
+
+
+def print_test_report(test_case, finished, result, log):
+    """Print a test's whole report at once, so concurrent tests don't interleave."""
+    if not finished:
+        print(f'Running {test_case["srcfile"]}... TIMED OUT')
+    else:
+        print(f'Running {test_case["srcfile"]}... {log} {"PASSED" if result else "FAILED"}')
+
+
+def run_worker(scaffold, connection):
+    """
+    Process entry point for a WorkerPool worker: warm up the scaffold once, then run each
+    test case received on connection and send back (score, captured stdout/stderr).
+    """
+    scaffold.warm_up()
+    while True:
+        test_case = connection.recv()
+        if test_case is None:
+            break
+        log = io.StringIO()
+        with redirect_stdout(log), redirect_stderr(log):
+            result = run_test(scaffold, test_case)
+        connection.send((result, log.getvalue()))
+    connection.close()
+
+
+class WorkerPool:
+    """
+    Long-lived worker processes that each load the scaffold (and so the implementation under
+    test) once, then run test cases sent to them over a pipe. Unlike the per-test processes of
+    run_test_process_wrapper, the pool can be reused across run_all_tests calls. A worker whose
+    test times out or crashes is killed and replaced.
+    """
+
+    def __init__(self, scaffold, size):
+        self.scaffold = scaffold
+        self.size = size
+        self.idle = [self.__start_worker() for _ in range(size)]
+
+    def __start_worker(self):
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=run_worker, args=(self.scaffold, worker_connection), daemon=True
+        )
+        process.start()
+        worker_connection.close()
+        return process, connection
+
+    def __stop_worker(self, worker, kill):
+        process, connection = worker
+        if kill:
+            process.kill()
+        else:
+            connection.send(None)
+        process.join()
+        connection.close()
+
+    async def run(self, test_case, timeout):
+        """
+        Run a test case on an idle worker; returns (finished, score, log), where score is None
+        if the test timed out or crashed. Callers must not run more than size tests at once.
+        """
+        worker = self.idle.pop()
+        _, connection = worker
+        connection.send(test_case)
+        finished = await asyncio.to_thread(connection.poll, timeout)
+        restart = not finished
+        result, log = None, ""
+        if finished:
+            try:
+                result, log = connection.recv()
+            except EOFError:  # the worker died without reporting a result
+                restart = True
+        if restart:
+            self.__stop_worker(worker, kill=True)
+            worker = self.__start_worker()
+        self.idle.append(worker)
+        return finished, result, log
+
+    def close(self):
+        """Shut down all workers."""
+        for worker in self.idle:
+            self.__stop_worker(worker, kill=False)
+        self.idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def run_test_pool_wrapper(pool, test_case, timeout, slots):
+    """Run a single test case on a WorkerPool worker, at most len(slots) at a time."""
+    async with slots:
+        finished, result, log = await pool.run(test_case, timeout)
+    print_test_report(test_case, finished, result, log)
+    return result
+
+
+class ResultCache:
+    """
+    Scores from earlier runs, saved as JSON at path. Each test case (by srcfile) keeps the
+    score of its latest run along with the scaffold's cache_key for that run; the score is
+    only reused while the key is unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if exists(path):
+            try:
+                with open(path, encoding="utf-8") as handle:
+                    self.entries = json.load(handle)
+            except (OSError, ValueError):
+                print(f"Ignoring unreadable test cache {path}")
+
+    def get(self, test_case, key):
+        """Return the cached score for test_case under key, or None."""
+        entry = self.entries.get(test_case["srcfile"])
+        if key is None or entry is None or entry["key"] != key:
+            return None
+        return entry["score"]
+
+    def put(self, test_case, key, score):
+        """Remember the score of a test case that just ran to completion under key."""
+        if key is not None:
+            self.entries[test_case["srcfile"]] = {"key": key, "score": score}
+
+    def save(self):
+        """Write the cache back to path."""
+        temp_path = f"{self.path}.{getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(self.entries, handle, indent=1)
+        replace(temp_path, self.path)
+
+
+async def run_tests(interpreter, tests, timeout_per_test, workers, pool):
+    """Run tests in the mode run_all_tests was asked for; returns their scores, in order."""
+    if pool is not None:
+        slots = asyncio.Semaphore(pool.size)
+        return await asyncio.gather(
+            *(run_test_pool_wrapper(pool, test, timeout_per_test, slots) for test in tests)
+        )
+    if workers:
+        # processes forked from here start out warmed up, rather than each doing it again
+        interpreter.warm_up()
+        slots = asyncio.Semaphore(workers)
+        return await asyncio.gather(
+            *(run_test_process_wrapper(interpreter, test, timeout_per_test, slots) for test in tests)
+        )
+    return [await run_test_wrapper(interpreter, test, timeout_per_test) for test in tests]
+
+
+async def run_all_tests(
+    interpreter, tests, timeout_per_test=5, zero_credit=False, workers=None, pool=None, cache=None
+):
     """
     Run all tests sequentially; defaults to 5s timeout per test.
+    With workers set, tests instead run in separate processes, up to workers at a time;
+    with a WorkerPool, they run on its workers (and interpreter is unused).
+    With a ResultCache, tests whose cache_key is unchanged since they last ran aren't rerun;
+    their cached scores are reported instead. Tests that time out or crash score 0 and are
+    left out of the cache, so they run again next time.
+    Either way, results are still returned in the order of tests.
     Each test case *must* have a name and srcfile key.
     """
     print(f"Running {len(tests)} tests...")
+    if zero_credit:
+        scores = [0] * len(tests)
+    else:
+        keys = [interpreter.cache_key(test) if cache is not None else None for test in tests]
+        scores = [cache.get(test, key) if cache is not None else None for test, key in zip(tests, keys)]
+        for test, score in zip(tests, scores):
+            if score is not None:
+                print(f'Running {test["srcfile"]}... (cached) {"PASSED" if score else "FAILED"}')
+
+        pending = [i for i, score in enumerate(scores) if score is None]
+        new_scores = await run_tests(
+            interpreter, [tests[i] for i in pending], timeout_per_test, workers, pool
+        )
+        for i, score in zip(pending, new_scores):
+            if score is None:  # timed out or crashed
+                scores[i] = 0
+            else:
+                scores[i] = score
+                if cache is not None:
+                    cache.put(tests[i], keys[i], score)
+        if cache is not None:
+            cache.save()
     results = [
         {
             "name": test["name"],
-            "score": await run_test_wrapper(interpreter, test, timeout_per_test) if not zero_credit else 0,
+            "score": score,
             "max_score": 1,
             "visibility": "visible"
             if test.get("visible", False)
             else "after_published",
         }
-        for test in tests
+        for test, score in zip(tests, scores)
     ]
     print(f"{get_score(results)}/{len(tests)} tests passed.")
     return results
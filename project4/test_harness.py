@@ -0,0 +1,144 @@
+"""
+Unit tests for harness.py's ResultCache, WorkerPool and run_all_tests caching.
+Run with `python -m unittest test_harness` from this directory.
+"""
+
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+
+from harness import AbstractTestScaffold, ResultCache, WorkerPool, run_all_tests
+
+
+class FakeScaffold(AbstractTestScaffold):
+    """Scores 1 for any test case, except "slow" (sleeps 10s) and "crash" (kills its process)."""
+
+    def setup(self, test_case):
+        return None
+
+    def run_test_case(self, test_case, environment):
+        if test_case["name"] == "slow":
+            time.sleep(10)
+        if test_case["name"] == "crash":
+            os._exit(1)  # pylint: disable=protected-access
+        return 1
+
+    def cache_key(self, test_case):
+        return "key"
+
+
+def make_test(name):
+    """A test case for FakeScaffold."""
+    return {"name": name, "srcfile": f"{name}.br"}
+
+
+class ResultCacheTest(unittest.TestCase):
+    """ResultCache lookups and persistence."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "cache.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_needs_matching_key(self):
+        cache = ResultCache(self.path)
+        test = make_test("a")
+        self.assertIsNone(cache.get(test, "k1"))
+        cache.put(test, "k1", 1)
+        self.assertEqual(cache.get(test, "k1"), 1)
+        self.assertIsNone(cache.get(test, "k2"))
+        self.assertIsNone(cache.get(test, None))
+
+    def test_none_key_is_never_stored(self):
+        cache = ResultCache(self.path)
+        cache.put(make_test("a"), None, 1)
+        self.assertEqual(cache.entries, {})
+
+    def test_save_and_reload(self):
+        cache = ResultCache(self.path)
+        cache.put(make_test("a"), "k", 0)
+        cache.save()
+        self.assertEqual(ResultCache(self.path).get(make_test("a"), "k"), 0)
+        self.assertEqual(os.listdir(self.temp_dir.name), ["cache.json"])
+
+    def test_unreadable_file_is_ignored(self):
+        with open(self.path, "w", encoding="utf-8") as handle:
+            handle.write("{not json")
+        with redirect_stdout(io.StringIO()):
+            cache = ResultCache(self.path)
+        self.assertEqual(cache.entries, {})
+
+
+class WorkerPoolTest(unittest.TestCase):
+    """WorkerPool runs tests on reused workers and replaces the ones that time out or crash."""
+
+    def test_worker_is_reused(self):
+        with WorkerPool(FakeScaffold(), 1) as pool:
+            pid = pool.idle[0][0].pid
+            self.assertEqual(asyncio.run(pool.run(make_test("a"), 5)), (True, 1, ""))
+            self.assertEqual(pool.idle[0][0].pid, pid)
+
+    def test_worker_is_replaced_after_timeout(self):
+        with WorkerPool(FakeScaffold(), 1) as pool:
+            worker = pool.idle[0][0]
+            self.assertEqual(asyncio.run(pool.run(make_test("slow"), 0.5)), (False, None, ""))
+            self.assertFalse(worker.is_alive())
+            self.assertNotEqual(pool.idle[0][0].pid, worker.pid)
+            self.assertEqual(asyncio.run(pool.run(make_test("a"), 5)), (True, 1, ""))
+
+    def test_worker_is_replaced_after_crash(self):
+        with WorkerPool(FakeScaffold(), 1) as pool:
+            pid = pool.idle[0][0].pid
+            self.assertEqual(asyncio.run(pool.run(make_test("crash"), 5)), (True, None, ""))
+            self.assertNotEqual(pool.idle[0][0].pid, pid)
+            self.assertEqual(asyncio.run(pool.run(make_test("a"), 5)), (True, 1, ""))
+
+
+class RunAllTestsCacheTest(unittest.TestCase):
+    """run_all_tests only caches the scores of tests that ran to completion."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "cache.json")
+        self.tests = [make_test("a"), make_test("slow"), make_test("crash")]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_tests(self, **kwargs):
+        """Run self.tests with a fresh ResultCache; returns their scores and the cached srcfiles."""
+        with redirect_stdout(io.StringIO()):
+            results = asyncio.run(
+                run_all_tests(FakeScaffold(), self.tests, timeout_per_test=0.5, cache=ResultCache(self.path), **kwargs)
+            )
+        with open(self.path, encoding="utf-8") as handle:
+            cached = sorted(json.load(handle))
+        return [result["score"] for result in results], cached
+
+    def test_workers(self):
+        self.assertEqual(self.run_tests(workers=2), ([1, 0, 0], ["a.br"]))
+
+    def test_pool(self):
+        with WorkerPool(FakeScaffold(), 2) as pool:
+            self.assertEqual(self.run_tests(pool=pool), ([1, 0, 0], ["a.br"]))
+
+    def test_cached_score_is_reused(self):
+        self.tests = [make_test("a")]
+        self.assertEqual(self.run_tests(workers=1), ([1], ["a.br"]))
+        self.tests = [make_test("a"), make_test("slow")]
+        with redirect_stdout(io.StringIO()) as log:
+            asyncio.run(
+                run_all_tests(FakeScaffold(), self.tests, timeout_per_test=0.5, cache=ResultCache(self.path), workers=1)
+            )
+        self.assertIn("a.br... (cached) PASSED", log.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,27 +1,95 @@
 """
 Implements all CS 131-related test logic; is entry-point for testing framework.
+
+usage: python tester.py VERSION [--zero-credit] [--workers [N]] [--pool [N]] [--cache] [--vm]
+
+Runs the tests in v<VERSION>/ of the working directory on the interpreterv<VERSION>.py found
+there (normally this directory; project-solution has its own v3/ and v4/ tests).
+
+--workers [N]  run each test in a fresh process, N at a time (N defaults to the CPU count).
+               Starting a process costs more than most tests take, so this is only faster
+               than the default sequential run for slow tests on several CPUs; use it when
+               tests must not share a process, and --pool otherwise.
+--pool [N]     run the tests on N long-lived worker processes, which are only replaced
+               after a test times out or crashes
+--cache        reuse the results of tests whose source and interpreter haven't changed
+--vm           run the tests on the interpreter's bytecode VM (interpreterv3 and interpreterv4)
 """
 
 import asyncio
+import hashlib
 import importlib
-from os import environ, listdir, getcwd
+from os import cpu_count, environ, listdir, getcwd, path
 import sys
 import traceback
 from operator import itemgetter
 
 from harness import (
     AbstractTestScaffold,
+    ResultCache,
+    WorkerPool,
     run_all_tests,
     get_score,
     write_gradescope_output,
 )
 
 
+CACHE_FILE = ".test_cache.json"
+
+
 class TestScaffold(AbstractTestScaffold):
-    """Implement scaffold for Brewin' interpreter; load file, validate syntax, run testcase."""
+    """
+    Implement scaffold for Brewin' interpreter; load file, validate syntax, run testcase.
+    interpreter_kwargs are passed on to every Interpreter it creates (e.g. use_vm=True).
+    """
 
-    def __init__(self, interpreter_lib):
+    def __init__(self, interpreter_lib, interpreter_kwargs=None):
         self.interpreter_lib = interpreter_lib
+        self.interpreter_kwargs = interpreter_kwargs or {}
+        self.implementation_hash = None
+
+    def __getstate__(self):
+        # modules can't be pickled, so send the interpreter's module name to worker processes
+        return {"interpreter_lib": self.interpreter_lib.__name__, "interpreter_kwargs": self.interpreter_kwargs}
+
+    def __setstate__(self, state):
+        self.interpreter_lib = importlib.import_module(state["interpreter_lib"])
+        self.interpreter_kwargs = state["interpreter_kwargs"]
+        self.implementation_hash = None
+
+    def warm_up(self):
+        """Build the lexer and parser tables now, rather than in a worker's first test."""
+        brewparse = importlib.import_module("brewparse")
+        brewparse.get_lexer()
+        brewparse.get_parser()
+
+    def cache_key(self, test_case):
+        """Hash of the test's source together with every module the interpreter imported."""
+        if self.implementation_hash is None:
+            self.implementation_hash = self.__hash_implementation()
+        digest = hashlib.sha256(self.implementation_hash.encode())
+        digest.update(str(test_case["expect_failure"]).encode())
+        digest.update(repr(sorted(self.interpreter_kwargs.items())).encode())
+        with open(test_case["srcfile"], "rb") as handle:
+            digest.update(handle.read())
+        return digest.hexdigest()
+
+    def __hash_implementation(self):
+        # the interpreter module and everything it loaded from its own directory (the
+        # env/type_value modules, brewparse, ply, ... and this tester)
+        root = path.dirname(path.abspath(self.interpreter_lib.__file__))
+        files = sorted(
+            path.abspath(module.__file__)
+            for module in list(sys.modules.values())
+            if getattr(module, "__file__", None)
+            and path.abspath(module.__file__).startswith(root + path.sep)
+        )
+        digest = hashlib.sha256()
+        for filename in files:
+            digest.update(path.relpath(filename, root).encode())
+            with open(filename, "rb") as handle:
+                digest.update(hashlib.sha256(handle.read()).digest())
+        return digest.hexdigest()
 
     def setup(self, test_case):
         srcfile = itemgetter("srcfile")(
@@ -34,7 +102,7 @@ class TestScaffold(AbstractTestScaffold):
         inp = self.__extract_test_data(prog_lines, "IN")
         expected = self.__extract_test_data(prog_lines, "OUT")
 
-        program = "\n".join(prog_lines)
+        program = "".join(prog_lines)
 
         return {
             "expected": expected,
@@ -47,14 +115,18 @@ class TestScaffold(AbstractTestScaffold):
         stdin, expected, program = itemgetter("stdin", "expected", "program")(
             environment
         )
-        interpreter = self.interpreter_lib.Interpreter(False, stdin, False)
+        interpreter = self.interpreter_lib.Interpreter(False, stdin, False, **self.interpreter_kwargs)
         try:
             interpreter.run(program)
         except Exception as exception:  # pylint: disable=broad-except
             if expect_failure:
 
-                error_type, _ = interpreter.get_error_type_and_line()
-                received = interpreter.get_output() + [f"{error_type}"]
+                error_type, error_line = interpreter.get_error_type_and_line()
+                error = f"{error_type}"
+                # the expected error may also name its line, e.g. "ErrorType.TYPE_ERROR on line 3"
+                if expected and " on line " in expected[-1]:
+                    error = f"{error_type} on line {error_line}"
+                received = interpreter.get_output() + [error]
 
                 if received == expected:
                     return 1
@@ -126,6 +198,8 @@ def __generate_test_suite(version, successes, failures):
     )
 
 def __get_file_names(folder_path):
+    if not path.isdir(folder_path):  # e.g. a version with tests but no fails
+        return []
     files_in_folder = listdir(folder_path)
     filenames = [file.split(".")[0] for file in files_in_folder]
     return filenames
@@ -171,16 +245,37 @@ def generate_test_suite_v4():
         fails,
     )
 
+def __get_workers(args, flag):
+    """
+    parses --workers [N] (run N tests at once, one process each) or --pool [N] (run tests on
+    N long-lived worker processes); N defaults to the CPU count
+    """
+    if flag not in args:
+        return None
+    index = args.index(flag) + 1
+    if index < len(args) and args[index].isdigit():
+        return int(args[index])
+    return cpu_count() or 1
+
 async def main():
     """main entrypoint: argparses, delegates to test scaffold, suite generator, gradescope output"""
     if not sys.argv:
         raise ValueError("Error: Missing version number argument")
     version = sys.argv[1]
-    zero_credit = len(sys.argv) > 2 and sys.argv[2] == '--zero-credit'
+    zero_credit = '--zero-credit' in sys.argv[2:]
+    workers = __get_workers(sys.argv[2:], "--workers")
+    pool_size = __get_workers(sys.argv[2:], "--pool")
+    # --cache reuses the results of tests whose source and interpreter haven't changed
+    cache = ResultCache(CACHE_FILE) if "--cache" in sys.argv[2:] else None
+    # --vm runs the tests on the interpreter's bytecode VM (interpreterv3 and interpreterv4)
+    interpreter_kwargs = {"use_vm": True} if "--vm" in sys.argv[2:] else None
+    # the interpreter is loaded from the working directory, like the tests in its v*/ folders,
+    # so another implementation can be tested with its own tests by running this from there
+    sys.path.insert(0, getcwd())
     module_name = f"interpreterv{version}"
     interpreter = importlib.import_module(module_name)
 
-    scaffold = TestScaffold(interpreter)
+    scaffold = TestScaffold(interpreter, interpreter_kwargs)
 
     match version:
         case "1":
@@ -194,7 +289,15 @@ async def main():
         case _:
             raise ValueError("Unsupported version; expect one of {1, 2, 3, 4}")
 
-    results = await run_all_tests(scaffold, tests, zero_credit=zero_credit)
+    if pool_size:
+        with WorkerPool(scaffold, pool_size) as pool:
+            results = await run_all_tests(
+                scaffold, tests, zero_credit=zero_credit, pool=pool, cache=cache
+            )
+    else:
+        results = await run_all_tests(
+            scaffold, tests, zero_credit=zero_credit, workers=workers, cache=cache
+        )
     total_score = get_score(results) / len(results) * 100.0
     print(f"Total Score: {total_score:9.2f}%")
 